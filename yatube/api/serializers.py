@@ -0,0 +1,89 @@
+# api/serializers.py
+"""Поля ресурсов API и их сериализация прямо из values().
+
+Ресурс описывается словарём «имя в ответе -> (поле для values(),
+преобразование значения или None)». Списки читаются одним values()
+только с запрошенными полями, без создания объектов моделей.
+"""
+from django.core.files.storage import default_storage
+from posts.models import PATH_SEGMENT
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def thread_depth(path):
+    return max(len(path) // PATH_SEGMENT - 1, 0)
+
+
+POST_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'pub_date': ('pub_date', None),
+    'updated_at': ('updated_at', None),
+    'author': ('author__username', None),
+    'group': ('group__slug', None),
+    'image': ('image', media_url),
+    'thumbnail': ('thumbnail', None),
+}
+
+POST_DETAIL_FIELDS = {
+    **POST_FIELDS,
+    'comments_count': ('comments_count', None),
+}
+
+COMMENT_FIELDS = {
+    'id': ('id', None),
+    'text': ('text', None),
+    'created': ('created', None),
+    'author': ('author__username', None),
+    'parent': ('parent_id', None),
+    'depth': ('path', thread_depth),
+}
+
+GROUP_FIELDS = {
+    'id': ('id', None),
+    'title': ('title', None),
+    'slug': ('slug', None),
+    'description': ('description', None),
+}
+
+PROFILE_FIELDS = {
+    'username': ('username', None),
+    'first_name': ('first_name', None),
+    'last_name': ('last_name', None),
+    'posts_count': ('stats__posts_count', None),
+    'followers_count': ('stats__followers_count', None),
+    'following_count': ('stats__following_count', None),
+}
+
+
+def requested_fields(spec, fields=None):
+    """Имена полей из параметра fields=a,b,c (по умолчанию все)."""
+    if not fields:
+        return list(spec)
+    names = [name.strip() for name in fields.split(',') if name.strip()]
+    unknown = [name for name in names if name not in spec]
+    if unknown:
+        raise FieldsError(f'Неизвестные поля: {", ".join(unknown)}.')
+    return names
+
+
+def lookups(spec, names, extra=()):
+    """Поля для values(): запрошенные плюс нужные, например, курсору."""
+    return sorted({spec[name][0] for name in names} | set(extra))
+
+
+def serialize(row, spec, names):
+    """Словарь ответа из строки values()."""
+    data = {}
+    for name in names:
+        lookup, convert = spec[name]
+        value = row[lookup]
+        data[name] = convert(value) if convert else value
+    return data
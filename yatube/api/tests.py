@@ -0,0 +1,181 @@
+# api/tests.py
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from posts.models import Comment, Follow, Group, Post, User
+
+
+@override_settings(POSTS_Q=2)
+class ApiTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author_user',
+                                         first_name='Лев')
+        cls.reader = User.objects.create(username='reader_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание группы',
+        )
+        cls.posts = [
+            Post.objects.create(author=cls.author, text=f'Пост {i}',
+                                group=cls.group if i % 2 else None)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_posts_are_paginated_by_cursor(self):
+        """Посты отдаются страницами по курсору от новых к старым."""
+        url = reverse('api:posts')
+        seen = []
+        while url:
+            data = self.guest_client.get(url).json()
+            seen += [post['id'] for post in data['results']]
+            url = data['next']
+        self.assertEqual(seen, [post.pk for post in self.posts[::-1]])
+
+    def test_sparse_fieldset(self):
+        """Параметр fields ограничивает поля ответа."""
+        response = self.guest_client.get(reverse('api:posts'),
+                                         {'fields': 'id,author,group'})
+        self.assertEqual(response.json()['results'][0], {
+            'id': self.posts[-1].pk,
+            'author': 'author_user',
+            'group': None,
+        })
+        response = self.guest_client.get(reverse('api:posts'),
+                                         {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_is_read_with_a_single_query(self):
+        """Страница списка читается одним запросом без COUNT(*)."""
+        url = reverse('api:group_posts', args=[self.group.slug])
+        self.guest_client.get(url)
+        # Запрос группы для ETag, группа во вью, страница постов.
+        with self.assertNumQueries(3):
+            data = self.guest_client.get(url).json()
+        self.assertEqual([post['id'] for post in data['results']],
+                         [self.posts[3].pk, self.posts[1].pk])
+
+    def test_conditional_get(self):
+        """Неизменившийся список отдаётся как 304, новый пост меняет ETag."""
+        url = reverse('api:posts')
+        etag = self.guest_client.get(url)['ETag']
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Post.objects.create(author=self.author, text='Новый пост')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(CACHE_SHARED=False)
+    def test_no_etag_without_shared_cache(self):
+        """С кешем процесса ETag по поколениям не отдаётся."""
+        url = reverse('api:post_detail', args=[self.posts[0].pk])
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+
+    def test_post_detail_etag_follows_comments(self):
+        """ETag поста меняется с новым комментарием."""
+        post = self.posts[0]
+        url = reverse('api:post_detail', args=[post.pk])
+        response = self.guest_client.get(url)
+        self.assertEqual(response.json()['comments_count'], 0)
+        etag = response['ETag']
+        Comment.objects.create(post=post, author=self.reader, text='Да')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['comments_count'], 1)
+
+    def test_post_detail_etag_follows_updated_at(self):
+        """ETag поста строится из updated_at, а он отдаётся в ответе."""
+        post = self.posts[1]
+        url = reverse('api:post_detail', args=[post.pk])
+        response = self.guest_client.get(url)
+        self.assertIn('updated_at', response.json())
+        etag = response['ETag']
+        Post.objects.filter(pk=post.pk).update(
+            text='Правка', updated_at=timezone.now())
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['text'], 'Правка')
+
+    def test_add_comment(self):
+        """Комментарий оставляет только авторизованный пользователь."""
+        url = reverse('api:comments', args=[self.posts[0].pk])
+        response = self.guest_client.post(url, {'text': 'Гость'})
+        self.assertEqual(response.status_code, 401)
+        response = self.reader_client.post(
+            url, {'text': 'Привет'}, content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['author'], 'reader_user')
+        response = self.reader_client.post(url, {'text': ''})
+        self.assertEqual(response.status_code, 400)
+        comments = self.guest_client.get(url).json()['results']
+        self.assertEqual([c['text'] for c in comments], ['Привет'])
+
+    def test_comment_thread(self):
+        """Ответы создаются с parent, ветка отдаётся в порядке обхода."""
+        post = self.posts[0]
+        url = reverse('api:comments', args=[post.pk])
+        root = self.reader_client.post(url, {'text': 'Вопрос'}).json()
+        reply = self.reader_client.post(
+            url, {'text': 'Ответ', 'parent': root['id']}).json()
+        self.assertEqual((reply['parent'], reply['depth']), (root['id'], 1))
+        self.reader_client.post(url, {'text': 'Ещё', 'parent': reply['id']})
+        thread_url = reverse('api:comment_thread', args=[post.pk, root['id']])
+        results = []
+        url = f'{thread_url}?fields=text,depth'
+        while url:
+            data = self.guest_client.get(url).json()
+            results += data['results']
+            url = data['next']
+        self.assertEqual(results, [
+            {'text': 'Вопрос', 'depth': 0},
+            {'text': 'Ответ', 'depth': 1},
+            {'text': 'Ещё', 'depth': 2},
+        ])
+        response = self.reader_client.post(
+            reverse('api:comments', args=[self.posts[1].pk]),
+            {'text': 'Чужая ветка', 'parent': root['id']})
+        self.assertEqual(response.status_code, 404)
+
+    def test_writes_require_csrf_token(self):
+        """Запись из сессии без CSRF-токена отклоняется."""
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.reader)
+        response = client.post(
+            reverse('api:follow', args=[self.author.username]))
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Follow.objects.exists())
+
+    def test_follow_and_unfollow(self):
+        """Подписка и отписка через API, повторная подписка не дублируется."""
+        url = reverse('api:follow', args=[self.author.username])
+        self.assertEqual(self.reader_client.post(url).status_code, 201)
+        self.assertEqual(self.reader_client.post(url).status_code, 200)
+        self.assertEqual(Follow.objects.count(), 1)
+        profile = self.reader_client.get(
+            reverse('api:profile', args=[self.author.username])).json()
+        self.assertTrue(profile['following'])
+        self.assertEqual(profile['followers_count'], 1)
+        self.reader_client.delete(url)
+        self.assertFalse(Follow.objects.exists())
+        response = self.reader_client.post(
+            reverse('api:follow', args=[self.reader.username]))
+        self.assertEqual(response.status_code, 400)
+
+    def test_errors_are_json(self):
+        """Ошибки отдаются в JSON."""
+        response = self.guest_client.get(reverse('api:post_detail',
+                                                 args=[0]))
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('error', response.json())
+        response = self.guest_client.delete(reverse('api:posts'))
+        self.assertEqual(response.status_code, 405)
@@ -0,0 +1,21 @@
+# api/urls.py
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    path('posts/', views.posts, name='posts'),
+    path('posts/<int:post_id>/', views.post_detail, name='post_detail'),
+    path('posts/<int:post_id>/comments/', views.comments, name='comments'),
+    path('posts/<int:post_id>/comments/<int:comment_id>/thread/',
+         views.comment_thread, name='comment_thread'),
+    path('groups/', views.groups, name='groups'),
+    path('groups/<slug:slug>/posts/', views.group_posts,
+         name='group_posts'),
+    path('users/<str:username>/', views.profile, name='profile'),
+    path('users/<str:username>/posts/', views.profile_posts,
+         name='profile_posts'),
+    path('users/<str:username>/follow/', views.follow, name='follow'),
+]
@@ -0,0 +1,309 @@
+# api/views.py
+"""JSON API v1 поверх тех же данных, что и HTML-страницы posts.
+
+Списки постов, групп и комментариев пагинируются курсором
+(?cursor=...), поля ответа выбираются параметром ?fields=a,b.
+ETag списков и поста считается по счётчикам поколений posts.caching,
+без обращения к самим данным, поэтому повторный запрос с
+If-None-Match обходится одним-двумя обращениями к кешу. Если кеш не
+общий для процессов (CACHE_SHARED), счётчики у воркеров свои, и такие
+ответы отдаются без ETag.
+
+Запись (комментарии, подписки) идёт от имени пользователя сессии и,
+как и формы сайта, требует CSRF-токен.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, set_response_etag
+from django.views.decorators.http import condition
+from posts import caching
+from posts.forms import CommentForm
+from posts.models import Comment, Follow, Group, Post, User
+from posts.utils import CURSOR_PARAM, CursorPaginator, get_reply_parent
+
+from .serializers import (COMMENT_FIELDS, GROUP_FIELDS, POST_DETAIL_FIELDS,
+                          POST_FIELDS, PROFILE_FIELDS, FieldsError, lookups,
+                          requested_fields, serialize)
+
+FIELDS_PARAM = 'fields'
+
+POST_ORDERING = ('-pub_date', '-id')
+COMMENT_ORDERING = ('-created', '-id')
+THREAD_ORDERING = ('path',)
+GROUP_ORDERING = ('slug',)
+
+
+class ApiError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def json_response(data, status=200):
+    return JsonResponse(
+        data, status=status, encoder=DjangoJSONEncoder,
+        json_dumps_params={'ensure_ascii': False},
+    )
+
+
+def error(status, message):
+    return json_response({'error': message}, status=status)
+
+
+def api_view(*methods):
+    """Ограничивает методы и отдаёт ошибки в JSON, а не HTML-страницей."""
+    if 'GET' in methods:
+        methods += ('HEAD',)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in methods:
+                response = error(405, 'Метод не поддерживается.')
+                response['Allow'] = ', '.join(methods)
+                return response
+            try:
+                return view(request, *args, **kwargs)
+            except Http404:
+                return error(404, 'Не найдено.')
+            except FieldsError as e:
+                return error(400, str(e))
+            except ApiError as e:
+                return error(e.status, e.message)
+        return wrapper
+    return decorator
+
+
+def login_required(view):
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            raise ApiError(401, 'Нужна авторизация.')
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def request_data(request):
+    """Данные формы из JSON-тела или из обычного POST."""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            raise ApiError(400, 'Тело запроса — не JSON.')
+        if not isinstance(data, dict):
+            raise ApiError(400, 'Ожидается JSON-объект.')
+        return data
+    return request.POST
+
+
+def make_etag(request, *parts):
+    """ETag из поколения данных и полного пути запроса с параметрами."""
+    raw = ':'.join(map(str, parts + (request.get_full_path(),)))
+    return hashlib.md5(raw.encode()).hexdigest()
+
+
+def generation_etag(etag_func):
+    """ETag по поколениям — только если их счётчики общие для процессов."""
+    @wraps(etag_func)
+    def wrapper(request, *args, **kwargs):
+        if not settings.CACHE_SHARED:
+            return None
+        return etag_func(request, *args, **kwargs)
+    return wrapper
+
+
+def conditional(response, request):
+    """ETag по содержимому — для ответов, у которых нет поколения."""
+    set_response_etag(response)
+    return get_conditional_response(
+        request, etag=response['ETag'], response=response)
+
+
+def page_response(request, queryset, spec, ordering):
+    names = requested_fields(spec, request.GET.get(FIELDS_PARAM))
+    rows = queryset.values(*lookups(
+        spec, names, [field.lstrip('-') for field in ordering]))
+    page = CursorPaginator(rows, settings.POSTS_Q, ordering).get_page(
+        request.GET.get(CURSOR_PARAM))
+    return json_response({
+        'results': [serialize(row, spec, names) for row in page],
+        'next': page_link(request, page.next_cursor),
+        'previous': page_link(request, page.previous_cursor),
+    })
+
+
+def page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params[CURSOR_PARAM] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+def object_data(request, queryset, spec):
+    names = requested_fields(spec, request.GET.get(FIELDS_PARAM))
+    row = queryset.values(*lookups(spec, names)).first()
+    if row is None:
+        raise Http404
+    return serialize(row, spec, names)
+
+
+@generation_etag
+def posts_etag(request):
+    return make_etag(request, caching.get_generation(caching.INDEX))
+
+
+@generation_etag
+def group_posts_etag(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return make_etag(request, caching.get_generation(caching.GROUP, group_id))
+
+
+@generation_etag
+def profile_posts_etag(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return make_etag(
+        request, caching.get_generation(caching.PROFILE, author_id))
+
+
+@generation_etag
+def post_etag(request, post_id):
+    # updated_at — из базы: правка поста меняет ETag, даже если счётчик
+    # поколения пропал из кеша.
+    updated_at = Post.objects.filter(pk=post_id).values_list(
+        'updated_at', flat=True).first()
+    if updated_at is None:
+        return None
+    return make_etag(request, updated_at.isoformat(),
+                     caching.get_generation(caching.POST, post_id))
+
+
+def comment_thread_etag(request, post_id, comment_id):
+    return post_etag(request, post_id)
+
+
+@api_view('GET')
+@condition(etag_func=posts_etag)
+def posts(request):
+    return page_response(request, Post.objects.all(), POST_FIELDS,
+                         POST_ORDERING)
+
+
+@api_view('GET')
+@condition(etag_func=group_posts_etag)
+def group_posts(request, slug):
+    group = get_object_or_404(Group.objects.only('pk'), slug=slug)
+    return page_response(request, group.posts.all(), POST_FIELDS,
+                         POST_ORDERING)
+
+
+@api_view('GET')
+@condition(etag_func=posts_etag)
+def groups(request):
+    # Изменение группы увеличивает поколение главной ленты.
+    return page_response(request, Group.objects.all(), GROUP_FIELDS,
+                         GROUP_ORDERING)
+
+
+@api_view('GET')
+def profile(request, username):
+    data = object_data(
+        request, User.objects.filter(username=username), PROFILE_FIELDS)
+    if request.user.is_authenticated:
+        data['following'] = Follow.objects.filter(
+            user=request.user, author__username=username).exists()
+    return conditional(json_response(data), request)
+
+
+@api_view('GET')
+@condition(etag_func=profile_posts_etag)
+def profile_posts(request, username):
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    return page_response(request, author.posts.all(), POST_FIELDS,
+                         POST_ORDERING)
+
+
+@api_view('GET')
+@condition(etag_func=post_etag)
+def post_detail(request, post_id):
+    return json_response(object_data(
+        request, Post.objects.filter(pk=post_id), POST_DETAIL_FIELDS))
+
+
+@api_view('GET', 'POST')
+def comments(request, post_id):
+    if request.method == 'POST':
+        return add_comment(request, post_id)
+    return comment_list(request, post_id)
+
+
+@condition(etag_func=post_etag)
+def comment_list(request, post_id):
+    if not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    return page_response(request, Comment.objects.filter(post_id=post_id),
+                         COMMENT_FIELDS, COMMENT_ORDERING)
+
+
+@api_view('GET')
+@condition(etag_func=comment_thread_etag)
+def comment_thread(request, post_id, comment_id):
+    """Комментарий и вся ветка ответов под ним в порядке обхода."""
+    comment = get_object_or_404(Comment.objects.only('path'),
+                                pk=comment_id, post_id=post_id)
+    return page_response(request, Comment.objects.subtree(comment),
+                         COMMENT_FIELDS, THREAD_ORDERING)
+
+
+@login_required
+def add_comment(request, post_id):
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
+    data = request_data(request)
+    form = CommentForm(data)
+    if not form.is_valid():
+        return json_response({'errors': form.errors}, status=400)
+    comment = form.save(commit=False)
+    comment.author = request.user
+    comment.post = post
+    comment.parent = get_reply_parent(post_id, data.get('parent'))
+    comment.save()
+    return json_response({
+        'id': comment.pk,
+        'text': comment.text,
+        'created': comment.created,
+        'author': request.user.username,
+        'parent': comment.parent_id,
+        'depth': comment.depth,
+    }, status=201)
+
+
+@api_view('POST', 'DELETE')
+@login_required
+def follow(request, username):
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    if request.method == 'DELETE':
+        Follow.objects.filter(user=request.user, author=author).delete()
+        return json_response({'following': False})
+    if author == request.user:
+        raise ApiError(400, 'Нельзя подписаться на самого себя.')
+    try:
+        with transaction.atomic():
+            Follow.objects.create(user=request.user, author=author)
+    except IntegrityError:
+        # Подписка уже есть: её держит ограничение unique_follow.
+        return json_response({'following': True})
+    return json_response({'following': True}, status=201)
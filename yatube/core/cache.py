@@ -0,0 +1,139 @@
+# core/cache.py
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class TwoTierCache(BaseCache):
+    """Общий кеш с небольшим LRU в памяти процесса перед ним.
+
+    Все операции выполняются в общем кеше (OPTIONS['SHARED'] — алиас из
+    CACHES). Ключи с префиксами из OPTIONS['LOCAL_PREFIXES'] вдобавок
+    оседают в локальном LRU. Удаление не доходит до LRU других
+    процессов, поэтому локально держать стоит только ключи, которые не
+    переписываются, например версионированные фрагменты лент.
+    """
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED', 'shared')
+        self._prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self._local_max_entries = options.get('LOCAL_MAX_ENTRIES', 128)
+        self._local_timeout = options.get('LOCAL_TIMEOUT', 60)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    def _is_local(self, key):
+        return bool(self._prefixes) and key.startswith(self._prefixes)
+
+    def _local_get(self, key, version):
+        with self._lock:
+            entry = self._local.get((key, version))
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._local[(key, version)]
+                return None
+            self._local.move_to_end((key, version))
+            return entry
+
+    def _local_set(self, key, value, timeout, version):
+        if timeout == DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        ttl = self._local_timeout
+        if timeout is not None:
+            ttl = min(ttl, timeout)
+        with self._lock:
+            self._local[(key, version)] = (value, time.monotonic() + ttl)
+            self._local.move_to_end((key, version))
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key, version):
+        with self._lock:
+            self._local.pop((key, version), None)
+
+    def get(self, key, default=None, version=None):
+        if self._is_local(key):
+            entry = self._local_get(key, version)
+            if entry is not None:
+                return entry[0]
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=version)
+        if value is sentinel:
+            return default
+        if self._is_local(key):
+            self._local_set(key, value, DEFAULT_TIMEOUT, version)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        remote = []
+        for key in keys:
+            entry = self._is_local(key) and self._local_get(key, version)
+            if entry:
+                found[key] = entry[0]
+            else:
+                remote.append(key)
+        if remote:
+            fetched = self.shared.get_many(remote, version=version)
+            for key, value in fetched.items():
+                if self._is_local(key):
+                    self._local_set(key, value, DEFAULT_TIMEOUT, version)
+            found.update(fetched)
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        if self._is_local(key):
+            self._local_set(key, value, timeout, version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if self._is_local(key) and key not in failed:
+                self._local_set(key, value, timeout, version)
+        return failed
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.add(key, value, timeout, version=version)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        self._local_delete(key, version)
+        self.shared.delete(key, version=version)
+
+    def delete_many(self, keys, version=None):
+        for key in keys:
+            self._local_delete(key, version)
+        self.shared.delete_many(keys, version=version)
+
+    def has_key(self, key, version=None):
+        if self._is_local(key) and self._local_get(key, version):
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        return self.shared.incr(key, delta, version=version)
+
+    def decr(self, key, delta=1, version=None):
+        return self.shared.decr(key, delta, version=version)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
@@ -0,0 +1,104 @@
+# core/management/commands/benchmark_startup.py
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Выполняется в отдельном интерпретаторе для каждого замера: время
+# загрузки WSGI-приложения, память и модули процесса, среднее время
+# запроса к статичной странице (без базы). DEBUG выключается в обоих
+# профилях, чтобы разница была только в подключённых приложениях.
+PROBE = '''
+import json, resource, sys, time
+started = time.perf_counter()
+from yatube.wsgi import application
+startup = time.perf_counter() - started
+from django.conf import settings
+from wsgiref.util import setup_testing_defaults
+settings.DEBUG = False
+
+def request():
+    environ = {'PATH_INFO': sys.argv[2]}
+    setup_testing_defaults(environ)
+    response = application(environ, lambda status, headers: None)
+    b''.join(response)
+    response.close()
+
+request()
+count = int(sys.argv[1])
+started = time.perf_counter()
+for _ in range(count):
+    request()
+per_request = (time.perf_counter() - started) / count
+print(json.dumps({
+    'startup_ms': startup * 1000,
+    'request_us': per_request * 1e6,
+    'maxrss_kib': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'debug_toolbar': 'debug_toolbar' in sys.modules,
+}))
+'''
+
+PROFILES = ('dev', 'prod')
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает профили настроек dev и prod: время загрузки '
+            'WSGI-приложения, память воркера и стоимость запроса.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--runs', type=int, default=5,
+            help='Сколько процессов запустить на профиль (медиана).'
+        )
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Сколько запросов отправить в каждом процессе.'
+        )
+        parser.add_argument(
+            '--path', default='/about/author/',
+            help='Страница для замера запросов (лучше без обращений к базе).'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести результат в формате JSON.'
+        )
+
+    def probe(self, profile, options):
+        env = dict(os.environ, YATUBE_ENV=profile,
+                   DJANGO_SETTINGS_MODULE='yatube.settings')
+        result = subprocess.run(
+            [sys.executable, '-c', PROBE, str(options['requests']),
+             options['path']],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+        )
+        if result.returncode:
+            raise CommandError(f'Профиль {profile}:\n{result.stderr}')
+        return json.loads(result.stdout.splitlines()[-1])
+
+    def handle(self, *args, **options):
+        report = {}
+        for profile in PROFILES:
+            runs = [self.probe(profile, options)
+                    for _ in range(options['runs'])]
+            report[profile] = {
+                metric: round(statistics.median(run[metric] for run in runs),
+                              1)
+                for metric in ('startup_ms', 'request_us', 'maxrss_kib',
+                               'modules')
+            }
+            report[profile]['debug_toolbar'] = runs[0]['debug_toolbar']
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'':<22}" + ''.join(
+            f'{profile:>12}' for profile in PROFILES))
+        for metric in ('startup_ms', 'request_us', 'maxrss_kib', 'modules',
+                       'debug_toolbar'):
+            self.stdout.write(f'{metric:<22}' + ''.join(
+                f'{str(report[profile][metric]):>12}'
+                for profile in PROFILES))
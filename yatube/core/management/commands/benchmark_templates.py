@@ -0,0 +1,133 @@
+# core/management/commands/benchmark_templates.py
+import json
+import statistics
+import time
+from copy import deepcopy
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.paginator import Paginator
+from django.template.backends.django import DjangoTemplates
+from django.test import RequestFactory
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from core.templating import compile_all
+from posts.models import Group, Post, User, UserStats
+
+LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
+# uncached — шаблоны читаются и разбираются на каждом запросе (так
+# было при APP_DIRS с DEBUG); cached — кеширующий загрузчик без
+# прогрева: разбор достаётся первому запросу; warmed — кеширующий
+# загрузчик после core.templating.compile_all, как в wsgi.py.
+MODES = ('uncached', 'cached', 'warmed')
+
+PAGES = {
+    'index': 'posts/index.html',
+    'group_posts': 'posts/group_list.html',
+    'profile': 'posts/profile.html',
+    'follow_index': 'posts/follow.html',
+}
+
+
+def backend(mode):
+    """Отдельный движок DTL с настройками проекта и нужными загрузчиками."""
+    params = deepcopy(settings.TEMPLATES[0])
+    params.pop('BACKEND')
+    params['NAME'] = f'benchmark-{mode}'
+    params['APP_DIRS'] = False
+    options = params.setdefault('OPTIONS', {})
+    options['debug'] = False
+    options['loaders'] = (LOADERS if mode == 'uncached'
+                          else [('django.template.loaders.cached.Loader',
+                                 LOADERS)])
+    engine = DjangoTemplates(params)
+    if mode == 'warmed':
+        compile_all(engine.engine)
+    return engine
+
+
+def feed_context(posts):
+    """Контекст ленты из несохранённых объектов: рендер без базы."""
+    author = User(pk=1, username='benchmark', first_name='Лев',
+                  last_name='Толстой')
+    author.stats = UserStats(posts_count=posts)
+    group = Group(pk=1, slug='benchmark', title='Группа',
+                  description='Описание группы')
+    now = timezone.now()
+    post_list = [
+        Post(pk=pk, text='Текст поста\n' * 5, author=author, group=group,
+             pub_date=now, updated_at=now)
+        for pk in range(posts, 0, -1)
+    ]
+    page_obj = Paginator(post_list, settings.POSTS_Q).get_page(1)
+    return author, {'page_obj': page_obj, 'group': group, 'author': author,
+                    'following': False}
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время рендера страниц лент без кеширования '
+            'шаблонов, с кеширующим загрузчиком и с прогревом кеша.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--repeat', type=int, default=200,
+            help='Сколько раз отрендерить каждую страницу.'
+        )
+        parser.add_argument(
+            '--posts', type=int, default=100,
+            help='Постов в ленте (на странице — POSTS_Q).'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести результат в формате JSON.'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным.')
+        user, context = feed_context(options['posts'])
+        request = RequestFactory().get('/')
+        request.user = user
+        # Кеш фрагментов лент иначе отдавал бы готовые карточки постов.
+        dummy = {'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+        with override_settings(CACHES=dummy):
+            report = {
+                page: {mode: self.measure(mode, name, context, request,
+                                          options['repeat'])
+                       for mode in MODES}
+                for page, name in PAGES.items()
+            }
+        if options['json']:
+            self.stdout.write(json.dumps(report, indent=2))
+            return
+        self.stdout.write(f"{'':<16}{'':<10}{'first_ms':>10}"
+                          f"{'p50_ms':>10}{'p95_ms':>10}")
+        for page, modes in report.items():
+            for mode, row in modes.items():
+                self.stdout.write(
+                    f'{page:<16}{mode:<10}{row["first_ms"]:>10}'
+                    f'{row["p50_ms"]:>10}{row["p95_ms"]:>10}')
+
+    def measure(self, mode, name, context, request, repeat):
+        # Свежий движок на страницу: первый рендер в cached платит за
+        # разбор, как первый запрос к новому воркеру.
+        engine = backend(mode)
+        timings = []
+        for _ in range(repeat + 1):
+            started = time.perf_counter()
+            engine.get_template(name).render(context, request)
+            timings.append((time.perf_counter() - started) * 1000)
+        first, timings = timings[0], sorted(timings[1:])
+        return {
+            'first_ms': round(first, 3),
+            'p50_ms': round(statistics.median(timings), 3),
+            'p95_ms': round(timings[min(len(timings) - 1,
+                                        round(0.95 * (len(timings) - 1)))],
+                            3),
+        }
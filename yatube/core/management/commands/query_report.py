@@ -0,0 +1,66 @@
+# core/management/commands/query_report.py
+import json
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import queries
+
+SORT_KEYS = ('total_ms', 'p95_ms', 'p99_ms', 'count', 'avg_ms')
+
+
+class Command(BaseCommand):
+    help = ('Сводит сводки SQL процессов из QUERY_LOG_DIR: запросы по '
+            'вью и отпечаткам с числом выполнений и перцентилями.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--view', action='append',
+            help='Только эти вью (например, posts:index); можно повторять.'
+        )
+        parser.add_argument(
+            '--sort', choices=SORT_KEYS, default='total_ms',
+            help='Поле сортировки, по убыванию (по умолчанию total_ms).'
+        )
+        parser.add_argument(
+            '--limit', type=int, default=20,
+            help='Сколько строк вывести (0 — все).'
+        )
+        parser.add_argument(
+            '--json', action='store_true',
+            help='Вывести строки отчёта в формате JSON.'
+        )
+        parser.add_argument(
+            '--reset', action='store_true',
+            help='После отчёта удалить сводки процессов.'
+        )
+
+    def handle(self, *args, **options):
+        directory = settings.QUERY_LOG_DIR
+        snapshots = queries.load_snapshots(directory)
+        rows = queries.aggregate(snapshots)
+        if options['view']:
+            rows = [row for row in rows if row['view'] in options['view']]
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+        if options['limit']:
+            rows = rows[:options['limit']]
+        if options['json']:
+            self.stdout.write(json.dumps(rows, ensure_ascii=False, indent=2))
+        else:
+            self.write_table(rows, len(snapshots))
+        if options['reset']:
+            for data in snapshots:
+                path = queries.snapshot_path(data['pid'])
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def write_table(self, rows, processes):
+        self.stdout.write(f'Процессов: {processes}, строк: {len(rows)}')
+        for row in rows:
+            self.stdout.write(
+                f"\n{row['view'] or '-'} [{row['fingerprint']}] "
+                f"x{row['count']} всего {row['total_ms']:.1f} ms, "
+                f"p50 {row['p50_ms']:.2f} p95 {row['p95_ms']:.2f} "
+                f"p99 {row['p99_ms']:.2f} ms")
+            self.stdout.write(f"  {row['sql']}")
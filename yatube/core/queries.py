@@ -0,0 +1,254 @@
+# core/queries.py
+"""Журнал медленных запросов и сводка SQL по отпечаткам.
+
+QueryLogMiddleware оборачивает соединения с базой на время запроса.
+Каждый SQL-запрос сводится к отпечатку (fingerprint): литералы и
+плейсхолдеры заменяются на ?, списки IN и VALUES схлопываются. Для
+каждой пары (вью, отпечаток) считаются число выполнений, суммарное
+время и последние QUERY_LOG_SAMPLES длительностей для перцентилей.
+
+Запросы дольше QUERY_LOG_SLOW_MS пишутся в логгер core.queries вместе
+с вью и строкой нашего кода, откуда запрос пришёл.
+
+Сводка живёт в памяти процесса и не реже раза в
+QUERY_LOG_FLUSH_SECONDS сбрасывается в QUERY_LOG_DIR/queries-<pid>.json;
+команда query_report сводит файлы всех процессов в отчёт.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import traceback
+from collections import deque
+from contextlib import ExitStack
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections
+
+from . import instrumentation
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PLACEHOLDER = re.compile(r'%s|%\(\w+\)s')
+_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)')
+_ROWS = re.compile(r'\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+')
+_SPACE = re.compile(r'\s+')
+
+_lock = threading.Lock()
+_stats = {}
+_statements = {}
+_started = time.monotonic()
+_last_flush = None
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql):
+    """SQL без литералов: одинаковый для запросов с разными параметрами."""
+    sql = _STRING.sub('?', sql)
+    sql = _PLACEHOLDER.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _LIST.sub('(...)', sql)
+    sql = _ROWS.sub('(...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+def fingerprint_id(statement):
+    return hashlib.md5(statement.encode()).hexdigest()[:12]
+
+
+# Обёртки execute_wrapper: их кадры есть в стеке каждого запроса.
+_WRAPPERS = {__file__, instrumentation.__file__}
+
+
+def caller():
+    """Ближайшая к запросу строка кода проекта (не Django и не обёрток
+    запросов) в виде path:line in function."""
+    for frame in reversed(traceback.extract_stack()):
+        path = frame.filename
+        if (path.startswith(settings.BASE_DIR) and path not in _WRAPPERS
+                and os.sep + 'site-packages' + os.sep not in path):
+            return (f'{os.path.relpath(path, settings.BASE_DIR)}:'
+                    f'{frame.lineno} in {frame.name}')
+    return None
+
+
+class QueryStats:
+    __slots__ = ('count', 'total', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=settings.QUERY_LOG_SAMPLES)
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        self.samples.append(duration)
+
+
+def record(view, sql, duration):
+    statement = fingerprint(sql)
+    key = (view, fingerprint_id(statement))
+    with _lock:
+        stats = _stats.get(key)
+        if stats is None:
+            stats = _stats[key] = QueryStats()
+            _statements[key[1]] = statement
+        stats.add(duration)
+    if duration * 1000 >= settings.QUERY_LOG_SLOW_MS:
+        logger.warning(
+            'Медленный запрос %.1f ms во вью %s из %s: %s',
+            duration * 1000, view, caller(), statement)
+
+
+class ViewQueries:
+    """Обёртка connection.execute_wrapper для одного запроса к вью."""
+
+    def __init__(self):
+        self.view = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            # Вью известна только после разрешения URL, запросы
+            # middleware до него попадают в сводку без вью.
+            record(self.view, sql, time.perf_counter() - started)
+
+
+def snapshot():
+    """Накопленная сводка процесса в виде, пригодном для JSON."""
+    with _lock:
+        return {
+            'pid': os.getpid(),
+            'updated': time.time(),
+            'queries': [
+                {
+                    'view': view,
+                    'fingerprint': key,
+                    'sql': _statements[key],
+                    'count': stats.count,
+                    'total_ms': stats.total * 1000,
+                    'samples_ms': [d * 1000 for d in stats.samples],
+                }
+                for (view, key), stats in _stats.items()
+            ],
+        }
+
+
+def snapshot_path(pid=None):
+    return os.path.join(settings.QUERY_LOG_DIR,
+                        f'queries-{pid or os.getpid()}.json')
+
+
+def flush():
+    """Записывает сводку процесса в QUERY_LOG_DIR атомарной заменой."""
+    global _last_flush
+    if _last_flush is None:
+        # Процесс прожил дольше QUERY_LOG_FLUSH_SECONDS — значит, это
+        # сервер, и остаток сводки стоит сохранить и при выходе.
+        atexit.register(_flush_at_exit)
+    _last_flush = time.monotonic()
+    data = snapshot()
+    if not data['queries']:
+        return
+    os.makedirs(settings.QUERY_LOG_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=settings.QUERY_LOG_DIR, suffix='.tmp')
+    with os.fdopen(fd, 'w') as file:
+        json.dump(data, file)
+    os.replace(tmp, snapshot_path())
+
+
+def reset():
+    with _lock:
+        _stats.clear()
+        _statements.clear()
+
+
+def _flush_at_exit():
+    try:
+        flush()
+    except Exception:
+        logger.exception('Не удалось сохранить сводку запросов')
+
+
+class QueryLogMiddleware:
+    """Собирает сводку SQL по вью; ставится в начало MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not settings.QUERY_LOG_ENABLED:
+            return self.get_response(request)
+        queries = request._view_queries = ViewQueries()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(queries))
+            response = self.get_response(request)
+        if (time.monotonic() - (_last_flush or _started)
+                >= settings.QUERY_LOG_FLUSH_SECONDS):
+            flush()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        queries = getattr(request, '_view_queries', None)
+        if queries is not None:
+            queries.view = request.resolver_match.view_name
+
+
+def load_snapshots(directory):
+    snapshots = []
+    if not os.path.isdir(directory):
+        return snapshots
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('queries-') and name.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, name)) as file:
+                snapshots.append(json.load(file))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def percentile(values, share):
+    return values[min(len(values) - 1, round(share * (len(values) - 1)))]
+
+
+def aggregate(snapshots):
+    """Сводит снимки процессов: строки отчёта по (вью, отпечаток)."""
+    merged = {}
+    for data in snapshots:
+        for item in data['queries']:
+            key = (item['view'], item['fingerprint'])
+            row = merged.setdefault(key, {
+                'view': item['view'],
+                'fingerprint': item['fingerprint'],
+                'sql': item['sql'],
+                'count': 0,
+                'total_ms': 0.0,
+                'samples_ms': [],
+            })
+            row['count'] += item['count']
+            row['total_ms'] += item['total_ms']
+            row['samples_ms'] += item['samples_ms']
+    rows = []
+    for row in merged.values():
+        samples = sorted(row.pop('samples_ms')) or [0.0]
+        row['total_ms'] = round(row['total_ms'], 3)
+        row['avg_ms'] = round(row['total_ms'] / row['count'], 3)
+        for name, share in (('p50_ms', 0.5), ('p95_ms', 0.95),
+                            ('p99_ms', 0.99)):
+            row[name] = round(percentile(samples, share), 3)
+        rows.append(row)
+    return rows
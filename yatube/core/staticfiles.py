@@ -0,0 +1,204 @@
+# core/staticfiles.py
+"""Статика с хешами в именах, сжатием и раздачей из процесса.
+
+CompressedManifestStaticFilesStorage — ManifestStaticFilesStorage,
+который после collectstatic кладёт рядом с каждым файлом с хешем его
+сжатые копии: .gz и, если установлен пакет brotli, .br. Сжатие идёт
+один раз при сборке, а не на каждом запросе.
+
+StaticFilesMiddleware раздаёт собранный STATIC_ROOT прямо из воркера,
+когда перед ним нет веб-сервера: выбирает сжатую копию по
+Accept-Encoding и ставит файлам с хешем годовой Cache-Control с
+immutable — при изменении файла меняется и его имя. Список файлов
+читается один раз при запуске, после collectstatic воркеры нужно
+перезапустить.
+"""
+import gzip
+import json
+import logging
+import mimetypes
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
+from django.utils.functional import cached_property
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.xml', '.html',
+                '.map', '.ico', '.ttf', '.otf', '.eot')
+# Меньшие файлы сжатие почти не уменьшает, а заголовков добавляет.
+MIN_COMPRESS_SIZE = 256
+# Копию, которая меньше оригинала не больше чем на 5%, не храним.
+MIN_COMPRESS_RATIO = 0.95
+# Сжатые копии; .br пропускается, даже если brotli уже не установлен.
+COMPRESSED = ('.gz', '.br')
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+
+
+def compressors():
+    """(Content-Encoding, расширение, функция) в порядке предпочтения."""
+    found = []
+    if brotli is not None:
+        found.append(('br', '.br', lambda data: brotli.compress(
+            data, quality=brotli.MAX_QUALITY)))
+    found.append(('gzip', '.gz', gzip_compress))
+    return found
+
+
+def gzip_compress(data):
+    # mtime=0: одинаковый файл при каждой сборке.
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if not dry_run:
+            for name in sorted(set(self.hashed_files.values())):
+                self.compress(name)
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as file:
+            data = file.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for _, suffix, compress in compressors():
+            packed = compress(data)
+            if len(packed) <= len(data) * MIN_COMPRESS_RATIO:
+                with open(path + suffix, 'wb') as file:
+                    file.write(packed)
+
+    def stored_name(self, name):
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            # collectstatic ещё не запускали или файла нет в манифесте:
+            # страница всё равно откроется, ссылка будет без хеша.
+            if name not in self.missing:
+                self.missing.add(name)
+                logger.warning('Нет %s в манифесте статики, запустите '
+                               'collectstatic', name)
+            return name
+
+    @cached_property
+    def missing(self):
+        return set()
+
+
+def accepted(header):
+    """Кодировки из Accept-Encoding, которые клиент не запретил (q=0)."""
+    codings = set()
+    for part in header.split(','):
+        coding, *params = part.split(';')
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition('=')
+            if name.strip() == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            codings.add(coding.strip().lower())
+    return codings
+
+
+class StaticFile:
+    __slots__ = ('path', 'mtime', 'content_type', 'variants',
+                 'cache_control')
+
+    def __init__(self, path, immutable):
+        self.path = path
+        self.mtime = os.stat(path).st_mtime
+        content_type, _ = mimetypes.guess_type(path)
+        self.content_type = content_type or 'application/octet-stream'
+        self.variants = [(encoding, path + suffix)
+                         for encoding, suffix, _ in compressors()
+                         if os.path.exists(path + suffix)]
+        self.cache_control = (
+            f'public, max-age={IMMUTABLE_MAX_AGE}, immutable' if immutable
+            else f'public, max-age={settings.STATIC_MAX_AGE}')
+
+    def response(self, request):
+        if not was_modified_since(
+                request.META.get('HTTP_IF_MODIFIED_SINCE'), self.mtime):
+            response = HttpResponseNotModified()
+        else:
+            encoding, path = self.choose(
+                request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            if request.method == 'HEAD':
+                response = HttpResponse(content_type=self.content_type)
+                response['Content-Length'] = os.path.getsize(path)
+            else:
+                response = FileResponse(open(path, 'rb'),
+                                        content_type=self.content_type)
+            if encoding:
+                response['Content-Encoding'] = encoding
+        response['Last-Modified'] = http_date(self.mtime)
+        response['Cache-Control'] = self.cache_control
+        if self.variants:
+            response['Vary'] = 'Accept-Encoding'
+        return response
+
+    def choose(self, accept_encoding):
+        codings = accepted(accept_encoding)
+        for encoding, path in self.variants:
+            if encoding in codings:
+                return encoding, path
+        return None, self.path
+
+
+def scan(root, prefix):
+    """{URL: StaticFile} для всех собранных файлов, кроме сжатых копий."""
+    immutable = set()
+    manifest = os.path.join(root, ManifestStaticFilesStorage.manifest_name)
+    if os.path.exists(manifest):
+        with open(manifest) as file:
+            immutable = set(json.load(file).get('paths', {}).values())
+    files = {}
+    for directory, _, names in os.walk(root):
+        for name in names:
+            path = os.path.join(directory, name)
+            if name.endswith(COMPRESSED) and os.path.exists(
+                    os.path.splitext(path)[0]):
+                continue
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            files[prefix + relative] = StaticFile(
+                path, relative in immutable)
+    return files
+
+
+class StaticFilesMiddleware:
+    """Раздаёт STATIC_ROOT из процесса; ставится первым в MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        if not settings.STATIC_SERVE:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        prefix = urlparse(settings.STATIC_URL).path
+        self.files = {}
+        if settings.STATIC_ROOT and os.path.isdir(settings.STATIC_ROOT):
+            self.files = scan(settings.STATIC_ROOT, prefix)
+        if not self.files:
+            logger.warning('STATIC_ROOT пуст, запустите collectstatic')
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD'):
+            static = self.files.get(request.path_info)
+            if static is not None:
+                return static.response(request)
+        return self.get_response(request)
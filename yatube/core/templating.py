@@ -0,0 +1,57 @@
+# core/templating.py
+"""Прогрев кеша шаблонов при запуске воркера.
+
+В боевом профиле шаблоны загружает django.template.loaders.cached:
+скомпилированный шаблон хранится в памяти процесса и при следующих
+рендерах не читается с диска и не разбирается заново. Без прогрева
+каждый воркер платит за разбор base.html, карточки поста и остальных
+шаблонов на первых запросах. warm_up() компилирует все шаблоны из
+каталогов DIRS заранее, в wsgi.py, до первого запроса.
+"""
+import logging
+import os
+import time
+
+from django.template import TemplateSyntaxError, engines
+
+logger = logging.getLogger(__name__)
+
+
+def template_names(engine):
+    """Имена всех шаблонов из каталогов DIRS движка."""
+    names = set()
+    for directory in engine.dirs:
+        for root, _, files in os.walk(directory):
+            for name in files:
+                if name.endswith(('.html', '.txt')):
+                    path = os.path.relpath(os.path.join(root, name),
+                                           directory)
+                    names.add(path.replace(os.sep, '/'))
+    return sorted(names)
+
+
+def compile_all(engine):
+    """Компилирует шаблоны DIRS движка; возвращает их число.
+
+    Шаблон с ошибкой пишется в лог и не мешает запуску: та же ошибка
+    всплывёт при рендере.
+    """
+    compiled = 0
+    for name in template_names(engine):
+        try:
+            engine.get_template(name)
+        except TemplateSyntaxError:
+            logger.exception('Не удалось скомпилировать шаблон %s', name)
+            continue
+        compiled += 1
+    return compiled
+
+
+def warm_up():
+    """Прогревает кеш шаблонов всех движков DTL из TEMPLATES."""
+    started = time.perf_counter()
+    compiled = sum(compile_all(backend.engine) for backend in engines.all()
+                   if hasattr(backend, 'engine'))
+    logger.info('Скомпилировано шаблонов: %d за %.1f ms', compiled,
+                (time.perf_counter() - started) * 1000)
+    return compiled
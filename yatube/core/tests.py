@@ -0,0 +1,274 @@
+# core/tests.py
+import gzip
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache, caches
+from django.core.management import call_command
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, SimpleTestCase, TestCase,
+                         override_settings)
+from django.urls import reverse
+
+from . import instrumentation, queries, staticfiles
+
+User = get_user_model()
+
+TWO_TIER_CACHES = {
+    'default': {
+        'BACKEND': 'core.cache.TwoTierCache',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ['hot:'],
+            'LOCAL_MAX_ENTRIES': 2,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'two-tier-tests',
+    },
+}
+
+
+@override_settings(CACHES=TWO_TIER_CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = caches['default']
+        self.shared = caches['shared']
+        self.cache.clear()
+
+    def test_hot_keys_served_from_process_memory(self):
+        """Горячий ключ читается из LRU, даже если общий кеш его забыл."""
+        self.cache.set('hot:index', 'html')
+        self.shared.delete('hot:index')
+        self.assertEqual(self.cache.get('hot:index'), 'html')
+
+    def test_other_keys_always_read_shared_cache(self):
+        """Обычные ключи читаются только из общего кеша."""
+        self.cache.set('gen:index', 1)
+        self.shared.set('gen:index', 2)
+        self.assertEqual(self.cache.get('gen:index'), 2)
+        self.assertEqual(self.cache.incr('gen:index'), 3)
+
+    def test_local_tier_is_bounded(self):
+        """LRU вытесняет самые старые ключи."""
+        for name in ('hot:1', 'hot:2', 'hot:3'):
+            self.cache.set(name, name)
+        self.shared.clear()
+        self.assertIsNone(self.cache.get('hot:1'))
+        self.assertEqual(
+            self.cache.get_many(['hot:2', 'hot:3']),
+            {'hot:2': 'hot:2', 'hot:3': 'hot:3'},
+        )
+
+
+@override_settings(INSTRUMENTATION_SAMPLE_RATE=1)
+class InstrumentationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='user')
+        cls.staff = User.objects.create(username='staff', is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        instrumentation.clear()
+        self.guest_client = Client()
+
+    def test_sampled_response_has_server_timing(self):
+        """Замеренный ответ содержит SQL, шаблоны и кеш в Server-Timing."""
+        timing = self.guest_client.get(reverse('posts:index'))[
+            'Server-Timing']
+        self.assertRegex(timing, r'app;dur=[\d.]+')
+        self.assertRegex(timing, r'db;dur=[\d.]+;desc="[1-9]\d* SQL"')
+        self.assertRegex(timing, r'tpl;dur=[\d.]+')
+        self.assertIn('cache;desc="hit 0 miss 1"', timing)
+
+    @override_settings(INSTRUMENTATION_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_recorded(self):
+        """Запросы вне выборки не замеряются."""
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertNotIn('Server-Timing', response)
+        self.assertEqual(instrumentation.stats()['samples'], 0)
+
+    def test_stats_are_staff_only(self):
+        """Сводку видит только персонал, в ней есть замеры по вью."""
+        for _ in range(2):
+            self.guest_client.get(reverse('posts:index'))
+        client = Client()
+        client.force_login(self.user)
+        url = reverse('core:instrumentation_stats')
+        self.assertEqual(client.get(url).status_code, 403)
+        client.force_login(self.staff)
+        index = client.get(url).json()['views']['posts:index']
+        self.assertEqual(index['samples'], 2)
+        self.assertEqual(index['cache_hit_ratio'], 0.5)
+        self.assertGreater(index['db_queries_avg'], 0)
+
+
+class FingerprintTests(SimpleTestCase):
+    def test_literals_and_lists_are_normalized(self):
+        """Запросы с разными параметрами дают один отпечаток."""
+        self.assertEqual(
+            queries.fingerprint(
+                "SELECT * FROM t WHERE id IN (%s, %s, %s) AND s = 'a''b'"
+                "  LIMIT 21"),
+            'SELECT * FROM t WHERE id IN (...) AND s = ? LIMIT ?',
+        )
+        self.assertEqual(
+            queries.fingerprint('INSERT INTO t (a, b) VALUES (%s, %s), '
+                                '(%s, %s)'),
+            queries.fingerprint('INSERT INTO t (a, b) VALUES (%s, %s)'),
+        )
+        self.assertEqual(queries.fingerprint('SELECT "t1"."id2" FROM t1'),
+                         'SELECT "t1"."id2" FROM t1')
+
+
+class QueryLogTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+        self.settings = override_settings(QUERY_LOG_DIR=self.directory)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        queries.reset()
+        self.addCleanup(queries.reset)
+        cache.clear()
+
+    @override_settings(QUERY_LOG_SLOW_MS=0)
+    def test_slow_queries_are_logged_with_view_and_caller(self):
+        """Медленный запрос попадает в лог с вью и строкой кода."""
+        with self.assertLogs('core.queries', 'WARNING') as logs:
+            Client().get(reverse('posts:index'))
+        self.assertIn('во вью posts:index из posts/', logs.output[0])
+
+    def test_report_aggregates_snapshots(self):
+        """query_report сводит сохранённые сводки по вью."""
+        for _ in range(3):
+            Client().get(reverse('posts:group_posts', args=['no-group']))
+        queries.flush()
+        out = StringIO()
+        call_command('query_report', '--json', '--view',
+                     'posts:group_posts', stdout=out)
+        rows = json.loads(out.getvalue())
+        self.assertTrue(rows)
+        self.assertEqual({row['view'] for row in rows},
+                         {'posts:group_posts'})
+        self.assertIn(3, [row['count'] for row in rows])
+        self.assertIn('p99_ms', rows[0])
+        call_command('query_report', '--reset', stdout=StringIO())
+        self.assertEqual(queries.load_snapshots(self.directory), [])
+
+
+class SettingsProfilesTests(SimpleTestCase):
+    def test_prod_does_not_load_debug_apps(self):
+        """В боевом профиле нет отладочных приложений и middleware."""
+        from yatube.settings import dev, prod
+
+        self.assertFalse(prod.DEBUG)
+        self.assertNotIn('debug_toolbar', prod.INSTALLED_APPS)
+        self.assertFalse(any(
+            name.startswith('debug_toolbar.') for name in prod.MIDDLEWARE))
+        self.assertIn('debug_toolbar', dev.INSTALLED_APPS)
+
+    def test_benchmark_startup(self):
+        """benchmark_startup замеряет оба профиля в отдельных процессах."""
+        out = StringIO()
+        call_command('benchmark_startup', '--runs', '1', '--requests', '1',
+                     '--json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['dev']['debug_toolbar'])
+        self.assertFalse(report['prod']['debug_toolbar'])
+        self.assertGreater(report['prod']['startup_ms'], 0)
+
+
+class TemplateWarmUpTests(SimpleTestCase):
+    def test_prod_caches_compiled_templates(self):
+        """В боевом профиле шаблоны грузит кеширующий загрузчик."""
+        from yatube.settings import prod
+
+        self.assertTrue(prod.TEMPLATE_WARMUP)
+        (loader, _), = prod.TEMPLATES[0]['OPTIONS']['loaders']
+        self.assertEqual(loader, 'django.template.loaders.cached.Loader')
+
+    def test_warm_up_fills_loader_cache(self):
+        """Прогрев кладёт шаблоны проекта в кеш загрузчика."""
+        from core.management.commands.benchmark_templates import backend
+        from core.templating import template_names
+
+        engine = backend('warmed').engine
+        cached = engine.template_loaders[0].get_template_cache
+        names = template_names(engine)
+        self.assertIn('includes/article.html', names)
+        self.assertEqual(len(cached), len(names))
+
+    def test_benchmark_templates(self):
+        """benchmark_templates замеряет ленты во всех режимах."""
+        out = StringIO()
+        call_command('benchmark_templates', '--repeat', '2', '--posts', '3',
+                     '--json', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual(set(report['index']),
+                         {'uncached', 'cached', 'warmed'})
+        self.assertGreater(report['profile']['warmed']['p50_ms'], 0)
+
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        source = os.path.join(directory, 'src')
+        os.makedirs(os.path.join(source, 'css'))
+        with open(os.path.join(source, 'css', 'app.css'), 'w') as file:
+            file.write('body { color: red; }\n' * 100)
+        self.settings = override_settings(
+            STATICFILES_DIRS=[source],
+            STATIC_ROOT=os.path.join(directory, 'out'),
+            STATICFILES_STORAGE=(
+                'core.staticfiles.CompressedManifestStaticFilesStorage'),
+            STATIC_SERVE=True,
+            INSTALLED_APPS=['django.contrib.staticfiles'],
+        )
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.middleware = staticfiles.StaticFilesMiddleware(
+            lambda request: HttpResponse('приложение'))
+        self.hashed = staticfiles_storage.url('css/app.css')
+
+    def get(self, url, **headers):
+        return self.middleware(RequestFactory().get(url, **headers))
+
+    def test_collectstatic_hashes_and_compresses(self):
+        """Файлы получают хеш в имени и сжатую копию рядом."""
+        self.assertRegex(self.hashed, r'^/static/css/app\.[0-9a-f]{12}\.css$')
+        path = staticfiles_storage.path(self.hashed[len('/static/'):])
+        with open(path, 'rb') as file, open(path + '.gz', 'rb') as packed:
+            self.assertEqual(gzip.decompress(packed.read()), file.read())
+
+    def test_hashed_files_are_served_compressed_and_immutable(self):
+        """Сжатая копия по Accept-Encoding и годовой кеш для хеша."""
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            gzip.decompress(b''.join(response.streaming_content)),
+            ('body { color: red; }\n' * 100).encode())
+        response = self.get(self.hashed, HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertNotIn('Content-Encoding', response)
+
+    def test_unhashed_files_and_other_urls(self):
+        """Файл без хеша кешируется ненадолго, прочее идёт в приложение."""
+        response = self.get('/static/css/app.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        response = self.get('/static/css/app.css', HTTP_IF_MODIFIED_SINCE=(
+            response['Last-Modified']))
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get('/static/css/none.css').content.decode(),
+                         'приложение')
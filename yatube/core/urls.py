@@ -0,0 +1,11 @@
+# core/urls.py
+from django.urls import path
+
+from . import views
+
+app_name = 'core'
+
+urlpatterns = [
+    path('stats/', views.instrumentation_stats,
+         name='instrumentation_stats'),
+]
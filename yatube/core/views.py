@@ -1,6 +1,10 @@
 # core/views.py
+from django.core.exceptions import PermissionDenied
+from django.http import JsonResponse
 from django.shortcuts import render
 
+from . import instrumentation
+
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
@@ -8,8 +12,8 @@ def page_not_found(request, exception):
     return render(request, 'core/404.html', {'path': request.path}, status=404)
 
 
-# def csrf_failure(request, reason=''):
-#     return render(request, 'core/403csrf.html')
+def csrf_failure(request, reason=''):
+    return render(request, 'core/403csrf.html', status=403)
 
 
 def server_error(request):
@@ -18,3 +22,10 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=403)
+
+
+def instrumentation_stats(request):
+    """Сводка замеров InstrumentationMiddleware этого процесса."""
+    if not request.user.is_staff:
+        raise PermissionDenied
+    return JsonResponse(instrumentation.stats())
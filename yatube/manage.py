@@ -6,6 +6,8 @@ import sys
 
 def main():
     os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    # Команды из консоли разработчика по умолчанию работают с dev.
+    os.environ.setdefault('YATUBE_ENV', 'dev')
     try:
         from django.core.management import execute_from_command_line
     except ImportError as exc:
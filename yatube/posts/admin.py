@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group, Comment
+from .search import matching
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -10,9 +11,21 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        # Вместо LIKE '%...%' по search_fields ищем по полнотекстовому
+        # индексу.
+        if not search_term.strip():
+            return queryset, False
+        return matching(queryset, search_term), False
+
+
+class CommentAdmin(admin.ModelAdmin):
+    # Выпадающий список всех комментариев в форме был бы огромным.
+    raw_id_fields = ('post', 'parent')
+
 
 admin.site.register(Post, PostAdmin)
 
 admin.site.register(Group)
 
-admin.site.register(Comment)
+admin.site.register(Comment, CommentAdmin)
@@ -0,0 +1,177 @@
+# posts/benchmarks.py
+"""Замеры вью posts на наполненной базе разного размера.
+
+Для каждого масштаба база наполняется posts.seeding, после чего каждый
+сценарий прогоняется тремя отдельными проходами, чтобы измерения не
+мешали друг другу:
+
+* время — repeat запросов без какого-либо инструментирования, первый
+  после очистки кеша считается «холодным»;
+* число SQL-запросов — один запрос под CaptureQueriesContext;
+* память — один запрос под tracemalloc (пик выделенной памяти).
+
+Результат — словарь, который команда benchmark_views пишет в JSON и
+сравнивает с отчётом другого коммита.
+"""
+import platform
+import subprocess
+import time
+import tracemalloc
+
+import django
+from django.core.cache import cache
+from django.db import connection
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Follow, Group, Post, User
+from .seeding import Seeder, rebuild_derived
+
+METRICS = ('cold_ms', 'p50_ms', 'p95_ms', 'min_ms', 'queries', 'peak_kib')
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(share * (len(values) - 1)))]
+
+
+def seed(posts, seed=0):
+    Seeder(
+        users=max(posts // 20, 10), groups=20, posts=posts,
+        comments=posts * 2, follows=20, seed=seed, prefix='bench_',
+    ).seed_all()
+    rebuild_derived()
+
+
+class Scenarios:
+    """Запросы сценариев на текущей базе.
+
+    Для лент берутся самые тяжёлые объекты: самая большая группа,
+    самый активный автор, самый обсуждаемый пост, самый подписанный
+    читатель.
+    """
+
+    def __init__(self):
+        self.group = Group.objects.annotate(
+            n=Count('posts')).order_by('-n').first()
+        self.author = User.objects.annotate(
+            n=Count('posts')).order_by('-n').first()
+        self.post = Post.objects.order_by('-comments_count').first()
+        reader_id = Follow.objects.values('user').annotate(
+            n=Count('pk')).order_by('-n').values_list(
+                'user', flat=True).first()
+        self.reader = User.objects.get(pk=reader_id) if reader_id else (
+            self.author)
+        self.guest = Client()
+        self.client = Client()
+        self.client.force_login(self.reader)
+        self.sequence = 0
+
+    def all(self):
+        return {
+            'index': lambda: self.guest.get(reverse('posts:index')),
+            'group_posts': lambda: self.guest.get(reverse(
+                'posts:group_posts', args=[self.group.slug])),
+            'profile': lambda: self.guest.get(reverse(
+                'posts:profile', args=[self.author.username])),
+            'post_detail': lambda: self.guest.get(reverse(
+                'posts:post_detail', args=[self.post.pk])),
+            'follow_index': lambda: self.client.get(
+                reverse('posts:follow_index')),
+            'post_create': lambda: self.client.post(
+                reverse('posts:post_create'),
+                {'text': self.text('Пост')}),
+            'add_comment': lambda: self.client.post(
+                reverse('posts:add_comment', args=[self.post.pk]),
+                {'text': self.text('Комментарий')}),
+        }
+
+    def text(self, prefix):
+        self.sequence += 1
+        return f'{prefix} замера {self.sequence}'
+
+
+def measure(request, repeat):
+    cache.clear()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = request()
+        timings.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Ответ {response.status_code}')
+    warm = timings[1:] or timings
+    with CaptureQueriesContext(connection) as queries:
+        request()
+    # Следующий запрос очистит журнал запросов соединения.
+    query_count = len(queries)
+    tracemalloc.start()
+    try:
+        request()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'cold_ms': round(timings[0], 3),
+        'p50_ms': round(percentile(warm, 0.5), 3),
+        'p95_ms': round(percentile(warm, 0.95), 3),
+        'min_ms': round(min(warm), 3),
+        'queries': query_count,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def run_scale(repeat, only=None):
+    scenarios = Scenarios().all()
+    return {
+        name: measure(request, repeat)
+        for name, request in scenarios.items()
+        if not only or name in only
+    }
+
+
+def metadata(repeat):
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'repeat': repeat,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def compare(baseline, report, threshold):
+    """Строки сравнения и список регрессий.
+
+    Регрессия — рост времени больше чем на threshold (доля) или любой
+    рост числа запросов.
+    """
+    lines = []
+    regressions = []
+    for scale, views in report['scales'].items():
+        for view, metrics in views.items():
+            old = baseline.get('scales', {}).get(scale, {}).get(view)
+            if old is None:
+                continue
+            for metric in ('p50_ms', 'queries', 'peak_kib'):
+                before, after = old.get(metric), metrics[metric]
+                if not before:
+                    continue
+                change = (after - before) / before
+                lines.append(
+                    f'{scale:>8} {view:<13} {metric:<9} '
+                    f'{before:>10} -> {after:<10} {change:+.1%}')
+                if metric == 'queries' and after > before or (
+                        metric == 'p50_ms' and change > threshold):
+                    regressions.append(f'{scale} {view} {metric}')
+    return lines, regressions
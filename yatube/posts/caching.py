@@ -0,0 +1,184 @@
+# posts/caching.py
+"""Версионируемый кеш фрагментов лент.
+
+У каждой ленты (главная, группа, профиль) есть счётчик поколения.
+Ключ фрагмента включает текущее поколение, поэтому фрагменты можно
+хранить часами: изменение поста или группы увеличивает счётчик, и
+следующий запрос просто не находит старый ключ.
+
+Это верно, только если кеш общий для всех процессов (CACHE_SHARED);
+с кешем процесса (locmem) фрагменты хранятся недолго.
+"""
+import hashlib
+import time
+
+from core import instrumentation
+from django.conf import settings
+from django.core.cache import cache
+
+INDEX = 'index'
+GROUP = 'group'
+PROFILE = 'profile'
+# Отдельный пост с комментариями (страница поста, API).
+POST = 'post'
+# Карточки постов кешируются по одной, см. card_key.
+CARD = 'post:card'
+
+HITS_KEY = 'feed:stats:hits'
+MISSES_KEY = 'feed:stats:misses'
+
+
+def _new_generation():
+    # Поколение, начатое после вытеснения счётчика из кеша, не должно
+    # совпасть со старым, поэтому начинаем не с единицы, а со времени.
+    return time.time_ns() // 1000
+
+
+def generation_key(scope, obj_id=None):
+    return f'feed:gen:{scope}:{obj_id or ""}'
+
+
+def modified_key(scope, obj_id=None):
+    return f'feed:mtime:{scope}:{obj_id or ""}'
+
+
+def get_generation(scope, obj_id=None):
+    key = generation_key(scope, obj_id)
+    generation = cache.get(key)
+    if generation is None:
+        generation = _start_generation(scope, obj_id)
+    return generation
+
+
+def _start_generation(scope, obj_id):
+    # Что менялось до появления счётчика, неизвестно, поэтому и время
+    # изменения считаем текущим.
+    key = generation_key(scope, obj_id)
+    cache.add(key, _new_generation(), None)
+    cache.add(modified_key(scope, obj_id), time.time(), None)
+    return cache.get(key, 0)
+
+
+def get_versions(scopes):
+    """Поколения лент [(scope, obj_id), ...] и время их изменения.
+
+    Возвращает список поколений в порядке scopes и время (timestamp)
+    последнего изменения любой из лент. Счётчики читаются одним
+    get_many.
+    """
+    keys = []
+    for scope, obj_id in scopes:
+        keys += [generation_key(scope, obj_id), modified_key(scope, obj_id)]
+    found = cache.get_many(keys)
+    generations = []
+    modified = 0
+    for scope, obj_id in scopes:
+        generation = found.get(generation_key(scope, obj_id))
+        mtime = found.get(modified_key(scope, obj_id))
+        if generation is None or mtime is None:
+            generation = _start_generation(scope, obj_id)
+            mtime = cache.get(modified_key(scope, obj_id), time.time())
+        generations.append(generation)
+        modified = max(modified, mtime)
+    return generations, modified
+
+
+def bump_generation(scope, obj_id=None):
+    key = generation_key(scope, obj_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_generation(), None)
+    cache.set(modified_key(scope, obj_id), time.time(), None)
+
+
+def fragment_key(scope, obj_id, vary_on):
+    vary = hashlib.md5(':'.join(map(str, vary_on)).encode()).hexdigest()
+    generation = get_generation(scope, obj_id)
+    return f'feed:frag:{scope}:{obj_id or ""}:{generation}:{vary}'
+
+
+def _count(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, 1, None)
+
+
+def get_fragment(key):
+    value = cache.get(key)
+    _count(MISSES_KEY if value is None else HITS_KEY)
+    instrumentation.record_cache(value is not None)
+    return value
+
+
+def set_fragment(key, value):
+    # Сброс поколения в кеше процесса другие воркеры не увидят: без
+    # общего кеша устаревший фрагмент живёт не дольше короткого TTL.
+    timeout = (settings.FEED_CACHE_TIMEOUT if settings.CACHE_SHARED
+               else settings.FEED_CACHE_LOCAL_TIMEOUT)
+    cache.set(key, value, timeout)
+
+
+def card_key(post, *flags):
+    """Ключ HTML карточки поста.
+
+    Версия — хеш всего, что выводит карточка помимо самого поста:
+    updated_at меняется при сохранении поста, а имя автора и адрес
+    группы — нет. Поэтому карточку не нужно сбрасывать, устаревший ключ
+    просто больше не запрашивается.
+    """
+    author = post.author
+    version = hashlib.md5(':'.join(map(str, (
+        post.updated_at.timestamp(), author.username,
+        author.get_full_name(), post.group.slug if post.group_id else '',
+        *flags,
+    ))).encode()).hexdigest()[:12]
+    return f'{CARD}:{post.pk}:{version}'
+
+
+def get_cards(keys):
+    """Готовые карточки одним get_many: {ключ: HTML}."""
+    found = cache.get_many(keys) if keys else {}
+    for key in keys:
+        instrumentation.record_cache(key in found)
+    return found
+
+
+def set_cards(cards):
+    if cards:
+        cache.set_many(cards, settings.POST_CARD_CACHE_TIMEOUT)
+
+
+def cache_stats():
+    """Попадания и промахи кеша лент по всем процессам."""
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {
+        'hits': hits,
+        'misses': misses,
+        'hit_ratio': round(hits / total, 4) if total else None,
+    }
+
+
+def invalidate_post(post, previous_group_id=None):
+    bump_generation(INDEX)
+    bump_generation(POST, post.pk)
+    bump_generation(PROFILE, post.author_id)
+    for group_id in {post.group_id, previous_group_id} - {None}:
+        bump_generation(GROUP, group_id)
+
+
+def invalidate_comments(post_id):
+    bump_generation(POST, post_id)
+
+
+def invalidate_profile(author_id):
+    # Счётчики подписчиков и кнопка подписки на странице автора.
+    bump_generation(PROFILE, author_id)
+
+
+def invalidate_group(group):
+    bump_generation(INDEX)
+    bump_generation(GROUP, group.pk)
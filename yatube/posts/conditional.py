@@ -0,0 +1,119 @@
+# posts/conditional.py
+"""Условные GET-запросы (ETag, Last-Modified) для страниц лент и поста.
+
+Валидаторы страницы строятся из счётчиков поколений posts.caching, а не
+из самих постов: им нужен максимум один запрос, чтобы найти id группы,
+автора или поста, и одно чтение кеша. Страница поста вдобавок берёт
+updated_at поста из того же запроса: он не теряется вместе с кешем.
+Если у клиента актуальная копия, вью и шаблоны не вызываются вовсе.
+
+Страница зависит и от того, кто её смотрит (шапка, кнопка подписки,
+CSRF-токен в форме комментария), поэтому в ETag входят пользователь и
+CSRF-cookie, а ответ помечается как private для вошедших.
+
+Счётчики поколений одинаковы у всех воркеров, только если кеш общий
+(CACHE_SHARED). С кешем процесса ETag и Last-Modified разных воркеров
+расходятся и не меняются от правок в других процессах, поэтому тогда
+страницы отдаются без валидаторов и 304.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from . import caching, writebehind
+from .models import Group, Post, User
+
+
+def page_validators(request, scopes, updated_at=None):
+    """(ETag, Last-Modified) страницы, собранной из лент scopes.
+
+    updated_at — время изменения поста, если страница выводит пост.
+    """
+    generations, modified = caching.get_versions(scopes)
+    if updated_at is not None:
+        modified = max(modified, updated_at.timestamp())
+    parts = [
+        settings.PAGES_ETAG_VERSION,
+        request.user.pk or '',
+        request.META.get('CSRF_COOKIE', ''),
+        request.get_full_path(),
+        writebehind.pending_token(request.user.pk),
+        updated_at.isoformat() if updated_at else '',
+        *generations,
+    ]
+    etag = hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest()
+    return etag, int(modified)
+
+
+def conditional_page(scopes_func):
+    """Отвечает 304, если ленты страницы не менялись.
+
+    scopes_func(request, *args, **kwargs) возвращает ленты страницы
+    [(scope, obj_id), ...] и updated_at её поста (или None) либо None,
+    если объекта нет — тогда 404 отдаёт сама вью.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or not settings.CACHE_SHARED):
+                return view(request, *args, **kwargs)
+            validators = scopes_func(request, *args, **kwargs)
+            if validators is None:
+                return view(request, *args, **kwargs)
+            etag, last_modified = page_validators(request, *validators)
+            etag = quote_etag(etag)
+            response = get_conditional_response(
+                request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response.setdefault('ETag', etag)
+                response.setdefault('Last-Modified', http_date(last_modified))
+                patch_cache_control(
+                    response, no_cache=True,
+                    private=request.user.is_authenticated)
+            return response
+        return wrapper
+    return decorator
+
+
+def index_scopes(request):
+    return [(caching.INDEX, None)], None
+
+
+def group_scopes(request, slug):
+    group_id = Group.objects.filter(slug=slug).values_list(
+        'pk', flat=True).first()
+    if group_id is None:
+        return None
+    return [(caching.GROUP, group_id)], None
+
+
+def profile_scopes(request, username):
+    author_id = User.objects.filter(username=username).values_list(
+        'pk', flat=True).first()
+    if author_id is None:
+        return None
+    return [(caching.PROFILE, author_id)], None
+
+
+def post_scopes(request, post_id):
+    row = Post.objects.filter(pk=post_id).values_list(
+        'author_id', 'group_id', 'updated_at').first()
+    if row is None:
+        return None
+    author_id, group_id, updated_at = row
+    # Страница поста выводит ещё число постов автора и название группы.
+    scopes = [(caching.POST, post_id), (caching.PROFILE, author_id)]
+    if group_id is not None:
+        scopes.append((caching.GROUP, group_id))
+    return scopes, updated_at
+
+
+def replies_scopes(request, post_id, comment_id):
+    """Ответы ветки меняются вместе с комментариями поста."""
+    return post_scopes(request, post_id)
@@ -0,0 +1,128 @@
+# posts/counters.py
+"""Денормализованные счётчики постов, комментариев и подписок.
+
+Счётчики меняются одним UPDATE ... SET n = n ± 1, поэтому параллельные
+запросы не теряют инкременты. Если строка UserStats отсутствует, она
+создаётся пересчётом с нуля.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Post, User, UserStats
+
+# Поле UserStats -> (модель, поле-ссылка на пользователя).
+SOURCES = {
+    'posts_count': (Post, 'author'),
+    'comments_count': (Comment, 'author'),
+    'followers_count': (Follow, 'author'),
+    'following_count': (Follow, 'user'),
+}
+
+
+def recount_user(user_id):
+    """Пересчитывает и сохраняет все счётчики пользователя."""
+    values = {
+        field: model.objects.filter(**{f'{link}_id': user_id}).count()
+        for field, (model, link) in SOURCES.items()
+    }
+    try:
+        with transaction.atomic():
+            UserStats.objects.update_or_create(
+                user_id=user_id, defaults=values)
+    except IntegrityError:
+        # Пользователь уже удалён: считать нечего.
+        pass
+
+
+def bump_user(user_id, field, delta):
+    stats = UserStats.objects.filter(user_id=user_id)
+    if delta < 0:
+        stats.filter(**{f'{field}__gte': -delta}).update(
+            **{field: F(field) + delta})
+    elif not stats.update(**{field: F(field) + delta}):
+        recount_user(user_id)
+
+
+def recount(field, user_ids):
+    """Пересчитывает по данным счётчик field пользователей user_ids.
+
+    Для случаев, когда неизвестно, сколько строк на самом деле
+    вставлено (bulk_create с ignore_conflicts): прибавка тогда могла бы
+    задвоить строки, вставленные параллельно.
+    """
+    user_ids = set(user_ids)
+    model, link = SOURCES[field]
+    stats = UserStats.objects.filter(user_id__in=user_ids)
+    if stats.update(**{field: _actual(model, link)}) < len(user_ids):
+        found = set(stats.values_list('user_id', flat=True))
+        for user_id in user_ids - found:
+            recount_user(user_id)
+
+
+def bump_post_comments(post_id, delta):
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta)
+
+
+def _actual(model, link):
+    counted = (
+        model.objects.filter(**{link: OuterRef('user')})
+        .order_by()
+        .values(link)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def reconcile(dry_run=False):
+    """Исправляет расхождения счётчиков с данными.
+
+    Возвращает (число исправленных UserStats, число исправленных Post).
+    """
+    missing = User.objects.filter(stats__isnull=True).values_list(
+        'pk', flat=True)
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=user_id) for user_id in missing.iterator()),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    actual = {
+        f'actual_{field}': _actual(model, link)
+        for field, (model, link) in SOURCES.items()
+    }
+    drift = Q()
+    for field in SOURCES:
+        drift |= ~Q(**{field: F(f'actual_{field}')})
+    stale_users = UserStats.objects.annotate(**actual).filter(drift)
+
+    comments = (
+        Comment.objects.filter(post=OuterRef('pk'))
+        .order_by()
+        .values('post')
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    stale_posts = Post.objects.annotate(
+        actual=Coalesce(Subquery(comments, output_field=IntegerField()), 0)
+    ).exclude(comments_count=F('actual'))
+
+    users_fixed = stale_users.count()
+    posts_fixed = stale_posts.count()
+    if dry_run:
+        return users_fixed, posts_fixed
+    with transaction.atomic():
+        UserStats.objects.filter(
+            pk__in=stale_users.values('pk')
+        ).update(**{
+            field: _actual(model, link)
+            for field, (model, link) in SOURCES.items()
+        })
+        Post.objects.filter(pk__in=stale_posts.values('pk')).update(
+            comments_count=Coalesce(
+                Subquery(comments, output_field=IntegerField()), 0)
+        )
+    return users_fixed, posts_fixed
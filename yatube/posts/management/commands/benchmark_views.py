@@ -0,0 +1,123 @@
+# posts/management/commands/benchmark_views.py
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from posts import benchmarks
+
+
+class Rollback(Exception):
+    pass
+
+
+def scales(value):
+    try:
+        return [int(scale) for scale in value.split(',')]
+    except ValueError:
+        raise CommandError('Масштабы задаются числами через запятую.')
+
+
+class Command(BaseCommand):
+    help = ('Замеряет время, число SQL-запросов и память вью posts на '
+            'наполненной базе нескольких масштабов и пишет JSON-отчёт. '
+            'Очищает кеш: не запускайте на боевом кеше.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--scales', type=scales, default=[1_000, 10_000, 100_000],
+            help='Число постов в базе, через запятую.'
+        )
+        parser.add_argument(
+            '--repeat', type=int, default=30,
+            help='Сколько раз выполнить каждый запрос для замера времени.'
+        )
+        parser.add_argument(
+            '--views', default='',
+            help='Замерять только эти сценарии (через запятую).'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--output', default='',
+            help='Куда записать JSON-отчёт.'
+        )
+        parser.add_argument(
+            '--compare', default='',
+            help='JSON-отчёт другого коммита для сравнения.'
+        )
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Допустимый рост p50 при сравнении (доля).'
+        )
+        parser.add_argument(
+            '--in-place', action='store_true',
+            help='Наполнять текущую базу (всё откатывается), а не '
+                 'отдельную тестовую.'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat должен быть положительным.')
+        only = [name for name in options['views'].split(',') if name]
+        old_name = None
+        if not options['in_place']:
+            old_name = connection.settings_dict['NAME']
+            connection.creation.create_test_db(
+                verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'],
+                                   DEBUG=False):
+                report = self.run(options['scales'], options['repeat'],
+                                  options['seed'], only)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump(report, file, indent=2, ensure_ascii=False)
+            self.stdout.write(f'Отчёт записан в {options["output"]}')
+        if options['compare']:
+            self.compare(options['compare'], report, options['threshold'])
+
+    def run(self, scales, repeat, seed, only):
+        report = {'meta': benchmarks.metadata(repeat), 'scales': {}}
+        for scale in scales:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'Постов в базе: {scale}'))
+            try:
+                with transaction.atomic():
+                    benchmarks.seed(scale, seed)
+                    report['scales'][str(scale)] = benchmarks.run_scale(
+                        repeat, only)
+                    raise Rollback
+            except Rollback:
+                pass
+        return report
+
+    def print_report(self, report):
+        header = ' '.join(f'{metric:>9}' for metric in benchmarks.METRICS)
+        for scale, views in report['scales'].items():
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{scale:>8} {"":<13}{header}'))
+            for view, metrics in views.items():
+                values = ' '.join(
+                    f'{metrics[metric]:>9}' for metric in benchmarks.METRICS)
+                self.stdout.write(f'{"":>8} {view:<13}{values}')
+
+    def compare(self, path, report, threshold):
+        try:
+            with open(path) as file:
+                baseline = json.load(file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f'Не удалось прочитать {path}: {e}')
+        lines, regressions = benchmarks.compare(baseline, report, threshold)
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f'Сравнение с {baseline.get("meta", {}).get("commit") or path}'))
+        for line in lines:
+            self.stdout.write(line)
+        if regressions:
+            raise CommandError('Регрессии: ' + ', '.join(regressions))
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
@@ -0,0 +1,96 @@
+# posts/management/commands/explain_feeds.py
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.feeds import rebuild_all_timelines
+from posts.models import Comment, Follow, Post
+from posts.seeding import Seeder
+
+# Индексы лент, которые --compare временно удаляет, чтобы показать
+# планы запросов «до».
+FEED_INDEXES = (
+    'post_pub_date_idx',
+    'post_author_pub_date_idx',
+    'post_group_pub_date_idx',
+    'comment_post_created_idx',
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ('Печатает планы запросов лент (EXPLAIN). Всё, что команда '
+            'меняет в базе, откатывается.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0, metavar='POSTS',
+            help='Сначала наполнить базу указанным числом постов.'
+        )
+        parser.add_argument(
+            '--compare', action='store_true',
+            help='Показать планы и с индексами лент, и без них.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    self.seed(options['seed'])
+                self.report('С индексами лент')
+                if options['compare']:
+                    quote = connection.ops.quote_name
+                    with connection.cursor() as cursor:
+                        for name in FEED_INDEXES:
+                            cursor.execute(f'DROP INDEX {quote(name)}')
+                    self.report('Без индексов лент')
+                raise Rollback
+        except Rollback:
+            pass
+
+    def queries(self):
+        post = Post.objects.order_by('-pk').first()
+        follow = Follow.objects.first()
+        group_id = post.group_id if post and post.group_id else 0
+        author_id = post.author_id if post else 0
+        user_id = follow.user_id if follow else 0
+        feed = Post.objects.for_feed()
+        per_page = settings.POSTS_Q
+        return {
+            'index': feed[:per_page],
+            'group_posts': feed.filter(group_id=group_id)[:per_page],
+            'profile': feed.filter(author_id=author_id)[:per_page],
+            'post_detail comments': Comment.objects.filter(
+                post_id=post.pk if post else 0).select_related('author'),
+            'follow_index': feed.filter(feed_entries__user_id=user_id)
+            .order_by('-feed_entries__pub_date')[:per_page],
+            'follow check': Follow.objects.filter(
+                user_id=user_id, author_id=author_id),
+        }
+
+    def explain(self, queryset, title):
+        # QuerySet.explain() здесь не подходит: sqlite3 кеширует
+        # подготовленные запросы по тексту и после DROP INDEX вернул бы
+        # старый план. Комментарий с заголовком делает текст уникальным.
+        sql, params = queryset.query.sql_with_params()
+        prefix = connection.ops.explain_query_prefix()
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql} /* {title} */', params)
+            return [' '.join(map(str, row)) for row in cursor.fetchall()]
+
+    def report(self, title):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, queryset in self.queries().items():
+            self.stdout.write(self.style.MIGRATE_LABEL(f'  {name}'))
+            for line in self.explain(queryset, title):
+                self.stdout.write(f'    {line}')
+
+    def seed(self, posts):
+        Seeder(
+            users=max(posts // 50, 2), groups=10, posts=posts,
+            comments=posts, follows=10, seed=posts, prefix='explain_',
+        ).seed_all()
+        rebuild_all_timelines()
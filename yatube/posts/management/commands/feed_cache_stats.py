@@ -0,0 +1,13 @@
+# posts/management/commands/feed_cache_stats.py
+import json
+
+from django.core.management.base import BaseCommand
+
+from posts.caching import cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Выводит попадания и промахи кеша лент в формате JSON.'
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(cache_stats()))
@@ -0,0 +1,14 @@
+# posts/management/commands/flush_write_behind.py
+from django.core.management.base import BaseCommand
+
+from posts import writebehind
+
+
+class Command(BaseCommand):
+    help = ('Записывает в базу операции из спулов отложенной записи, '
+            'оставшиеся от остановленных процессов.')
+
+    def handle(self, *args, **options):
+        applied = writebehind.flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записано операций: {applied}'))
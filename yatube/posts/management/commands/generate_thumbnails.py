@@ -0,0 +1,38 @@
+# posts/management/commands/generate_thumbnails.py
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Нарезает варианты картинок постов, для которых их ещё нет '
+            '(например, созданных через админку или загруженных массово).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Пересчитать варианты всех постов с картинками.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=50,
+            help='Сколько картинок нарезать за один проход пула.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число потоков пула (по умолчанию — по числу CPU).'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if not options['all']:
+            posts = posts.filter(thumbnail='')
+        rows = list(posts.order_by('pk').values_list('pk', 'image'))
+        size = options['batch_size']
+        done = 0
+        for start in range(0, len(rows), size):
+            done += thumbnails.generate_many(rows[start:start + size],
+                                             options['workers'])
+            self.stdout.write(f'  {min(start + size, len(rows))}/{len(rows)}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано постов: {done}'))
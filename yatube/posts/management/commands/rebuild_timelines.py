@@ -0,0 +1,33 @@
+# posts/management/commands/rebuild_timelines.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.feeds import rebuild_all_timelines, rebuild_timeline
+from posts.models import User
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает материализованные ленты подписок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'usernames', nargs='*',
+            help=('Пользователи, чьи ленты нужно пересобрать '
+                  '(по умолчанию все).')
+        )
+
+    def handle(self, *args, **options):
+        if not options['usernames']:
+            with transaction.atomic():
+                entries = rebuild_all_timelines()
+            self.stdout.write(self.style.SUCCESS(
+                f'Все ленты пересобраны, записей: {entries}'))
+            return
+        users = User.objects.filter(username__in=options['usernames'])
+        rebuilt = 0
+        for user_id in users.values_list('pk', flat=True).iterator():
+            with transaction.atomic():
+                rebuild_timeline(user_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересобрано лент: {rebuilt}'))
@@ -0,0 +1,20 @@
+# posts/management/commands/reconcile_counters.py
+from django.core.management.base import BaseCommand
+
+from posts.counters import reconcile
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики с данными и исправляет их.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только посчитать расхождения, ничего не меняя.'
+        )
+
+    def handle(self, *args, **options):
+        users, posts = reconcile(dry_run=options['dry_run'])
+        verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} расхождений: пользователи — {users}, посты — {posts}'))
@@ -0,0 +1,79 @@
+# posts/management/commands/seed_yatube.py
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from posts.seeding import Seeder, rebuild_derived
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу большим воспроизводимым набором пользователей, '
+            'групп, постов, комментариев и подписок для замеров.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10_000)
+        parser.add_argument('--groups', type=int, default=50)
+        parser.add_argument('--posts', type=int, default=100_000)
+        parser.add_argument('--comments', type=int, default=200_000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument(
+            '--skew', type=float, default=1.1,
+            help='Показатель степенного закона популярности авторов.'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней назад разбросать даты постов.'
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Число процессов для вставки постов, комментариев и '
+                 'подписок (на SQLite всегда один).'
+        )
+        parser.add_argument(
+            '--prefix', default='seed_',
+            help='Префикс имён пользователей и slug групп.'
+        )
+        parser.add_argument(
+            '--skip-derived', action='store_true',
+            help='Не пересобирать счётчики, ленты, индекс поиска и кеш.'
+        )
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Нужен хотя бы один пользователь.')
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite пишет в один поток: процессы только ждали бы
+            # блокировку базы.
+            self.stderr.write('SQLite: вставка идёт в одном процессе.')
+            workers = 1
+        seeder = Seeder(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            skew=options['skew'],
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            workers=workers,
+            prefix=options['prefix'],
+            log=self.log,
+        )
+        self.started = time.monotonic()
+        seeder.seed_all()
+        if not options['skip_derived']:
+            rebuild_derived(log=self.log)
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.monotonic() - self.started:.1f} с'))
+
+    def log(self, message):
+        elapsed = time.monotonic() - self.started
+        self.stdout.write(f'[{elapsed:7.1f} с] {message}')
@@ -0,0 +1,60 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:11
+
+from django.db import migrations, models
+
+
+def drop_duplicate_follows(apps, schema_editor):
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+    keep = (
+        Follow.objects.order_by().values('user', 'author')
+        .annotate(keep_id=models.Min('id')).values('keep_id')
+    )
+    duplicates = Follow.objects.exclude(id__in=keep)
+    pairs = set(duplicates.values_list('user_id', 'author_id'))
+    if not pairs:
+        return
+    duplicates.delete()
+    # 0008 посчитала подписки вместе с повторами: пересчитываем затронутых.
+    for field, link, ids in (
+        ('following_count', 'user', {user for user, _ in pairs}),
+        ('followers_count', 'author', {author for _, author in pairs}),
+    ):
+        counts = dict(
+            Follow.objects.filter(**{f'{link}__in': ids}).order_by()
+            .values_list(link).annotate(n=models.Count('pk'))
+        )
+        for pk in ids:
+            UserStats.objects.filter(user_id=pk).update(
+                **{field: counts.get(pk, 0)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_counters'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', '-created'], name='comment_post_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-pub_date', '-id'], name='post_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', '-pub_date'], name='post_author_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['group', '-pub_date'], name='post_group_pub_date_idx'),
+        ),
+        migrations.RunPython(drop_duplicate_follows, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='follow',
+            constraint=models.UniqueConstraint(fields=('user', 'author'), name='unique_follow'),
+        ),
+    ]
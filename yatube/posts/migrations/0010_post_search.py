@@ -0,0 +1,40 @@
+from django.db import migrations
+
+SQLITE_FORWARDS = (
+    "CREATE VIRTUAL TABLE posts_post_fts USING fts5("
+    "text, tokenize = 'unicode61 remove_diacritics 2')",
+    "INSERT INTO posts_post_fts (rowid, text) SELECT id, text FROM posts_post",
+)
+SQLITE_BACKWARDS = (
+    "DROP TABLE IF EXISTS posts_post_fts",
+)
+POSTGRESQL_FORWARDS = (
+    "CREATE INDEX IF NOT EXISTS posts_post_text_search_idx ON posts_post "
+    "USING GIN (to_tsvector('russian'::regconfig, COALESCE(text, '')))",
+)
+POSTGRESQL_BACKWARDS = (
+    "DROP INDEX IF EXISTS posts_post_text_search_idx",
+)
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, ()):
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0009_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'sqlite': SQLITE_FORWARDS,
+                 'postgresql': POSTGRESQL_FORWARDS}),
+            run({'sqlite': SQLITE_BACKWARDS,
+                 'postgresql': POSTGRESQL_BACKWARDS}),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:56
+
+from django.db import migrations, models
+from django.db.models import F, Func, Value
+from django.db.models.functions import LPad
+import django.db.models.deletion
+
+
+def place_roots(apps, schema_editor):
+    # Все существующие комментарии — корни своих веток.
+    Comment = apps.get_model('posts', 'Comment')
+    if schema_editor.connection.vendor == 'postgresql':
+        segment = LPad(Func(F('id'), function='to_hex'), 10, Value('0'))
+    else:
+        segment = Func(Value('%010x'), F('id'), function='printf')
+    Comment.objects.filter(path='').update(path=segment, thread=F('id'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='replies', to='posts.Comment', verbose_name='Ответ на комментарий'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, editable=False, max_length=250, verbose_name='Путь в ветке'),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='thread',
+            field=models.PositiveIntegerField(editable=False, help_text='id корневого комментария ветки', null=True, verbose_name='Ветка'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'path'], name='comment_thread_path_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['path'], name='comment_path_idx'),
+        ),
+        migrations.RunPython(place_roots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userstats',
+            name='feed_on_read',
+            field=models.BooleanField(default=False, help_text='Посты автора раскладывались не во все ленты подписок', verbose_name='Посты подмешиваются в ленты при чтении'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0015_userstats_feed_on_read'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='writebehind_id',
+            field=models.CharField(blank=True, editable=False, help_text='id операции posts.writebehind, записавшей комментарий', max_length=32, null=True, unique=True, verbose_name='Операция отложенной записи'),
+        ),
+    ]
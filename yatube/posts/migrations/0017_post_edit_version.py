@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_comment_writebehind_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='edit_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Растёт только с правкой автора, см. claim_version', verbose_name='Версия правки'),
+        ),
+    ]
@@ -1,5 +1,10 @@
+import json
+
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models import F, Func, OuterRef, Q, Subquery, Value
+from django.db.models.functions import LPad
+from django.utils.functional import cached_property
 
 User = get_user_model()
 
@@ -13,6 +18,22 @@ class Group(models.Model):
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты с полями, которые выводит карточка includes/article.html."""
+        return self.select_related('author', 'group').only(
+            'text', 'pub_date', 'updated_at', 'image', 'thumbnail',
+            'image_variants',
+            'author', 'author__username',
+            'author__first_name', 'author__last_name',
+            'group', 'group__slug', 'group__title',
+        )
+
+    def for_detail(self):
+        """Пост со всем, что выводит страница posts/post_detail.html."""
+        return self.select_related('author', 'author__stats', 'group')
+
+
 class Post(models.Model):
     text = models.TextField(
         'Текст поста',
@@ -22,6 +43,11 @@ class Post(models.Model):
         'Дата публикации',
         auto_now_add=True
     )
+    updated_at = models.DateTimeField(
+        'Дата изменения',
+        auto_now=True,
+        help_text='Версия поста для кеша карточек',
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -40,15 +66,162 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    thumbnail = models.CharField(
+        'Миниатюра',
+        max_length=255,
+        blank=True,
+        editable=False,
+    )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        editable=False,
+        help_text='JSON: MIME-тип -> srcset, см. posts/thumbnails.py',
+    )
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0,
+        editable=False,
+    )
+    edit_version = models.PositiveIntegerField(
+        'Версия правки',
+        default=0,
+        editable=False,
+        help_text='Растёт только с правкой автора, см. claim_version',
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ['-pub_date']
         verbose_name = 'Пост'
         verbose_name_plural = 'Посты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='post_pub_date_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date'],
+                name='post_author_pub_date_idx'
+            ),
+            models.Index(
+                fields=['group', '-pub_date'],
+                name='post_group_pub_date_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def version(self):
+        """Версия поста для формы редактирования.
+
+        Не updated_at: его сдвигают и фоновые задачи (миниатюры), а они
+        не должны давать автору ложный конфликт правок.
+        """
+        return str(self.edit_version)
+
+    def claim_version(self, version):
+        """Оптимистичная блокировка перед сохранением правки.
+
+        Проверяет, что пост не правили с версии version, и тут же сдвигает
+        edit_version в базе, чтобы вторая правка с той же версией её уже не
+        прошла. Вызывается в транзакции, вместе с save().
+        """
+        if version != self.version or not Post.objects.filter(
+            pk=self.pk, edit_version=self.edit_version,
+        ).update(edit_version=F('edit_version') + 1):
+            return False
+        # save() пишет все поля: без этого он вернул бы старую версию.
+        self.edit_version += 1
+        return True
+
+    @cached_property
+    def _variants(self):
+        try:
+            return list(json.loads(self.image_variants).items())
+        except (ValueError, AttributeError):
+            return []
+
+    @property
+    def image_sources(self):
+        """Пары (MIME-тип, srcset) для <source> элемента <picture>."""
+        return self._variants[:-1]
+
+    @property
+    def image_srcset(self):
+        """srcset для <img> в исходном формате картинки."""
+        return self._variants[-1][1] if self._variants else ''
+
+
+# Ветки комментариев хранятся материализованным путём: path — путь
+# родителя и id самого комментария в PATH_SEGMENT шестнадцатеричных
+# цифрах, thread — id корня ветки. Порядок по path — обход ветки в
+# глубину, а поддерево — диапазон path, который читается по индексу
+# одним запросом на любой глубине.
+PATH_SEGMENT = 10
+MAX_THREAD_DEPTH = 25
+
+
+def path_segment(comment_id):
+    return f'{comment_id:0{PATH_SEGMENT}x}'
+
+
+class CommentQuerySet(models.QuerySet):
+    def roots(self):
+        return self.filter(parent__isnull=True)
+
+    def subtree(self, comment):
+        """Комментарий и все ответы на него в порядке обхода ветки."""
+        # Шестнадцатеричные цифры идут раньше 'g' при любой сортировке
+        # строк, так что это верхняя граница всех путей с префиксом.
+        return self.filter(
+            path__gte=comment.path, path__lt=comment.path + 'g',
+        ).order_by('path')
+
+    def with_replies_cutoff(self, limit):
+        """Корни веток с путём (limit + 1)-го ответа в replies_cutoff.
+
+        Ответы с путём меньше него — первые limit ответов ветки в
+        порядке обхода; None — больше ответов в ветке нет. Каждый путь
+        достаётся поиском по индексу (thread, path).
+        """
+        cutoff = self.model.objects.filter(
+            thread=OuterRef('pk'), parent__isnull=False,
+        ).order_by('path').values('path')[limit:limit + 1]
+        return self.annotate(replies_cutoff=Subquery(cutoff))
+
+    def replies_before_cutoff(self, roots):
+        """Первые ответы веток roots (см. with_replies_cutoff) в порядке
+        обхода веток."""
+        condition = Q()
+        for root in roots:
+            if root.replies_cutoff is None:
+                condition |= Q(thread=root.pk)
+            else:
+                condition |= Q(thread=root.pk,
+                               path__lt=root.replies_cutoff)
+        if not condition:
+            return self.none()
+        return self.filter(condition, parent__isnull=False).order_by(
+            'thread', 'path')
+
+    def place_roots(self):
+        """Делает корнями веток комментарии, вставленные мимо save().
+
+        bulk_create (например, при наполнении базы) не проставляет path
+        и thread; их дописывает один UPDATE.
+        """
+        if connection.vendor == 'postgresql':
+            segment = LPad(Func(F('id'), function='to_hex'),
+                           PATH_SEGMENT, Value('0'))
+        else:
+            segment = Func(Value(f'%0{PATH_SEGMENT}x'), F('id'),
+                           function='printf')
+        return self.filter(path='').update(path=segment, thread=F('id'))
+
 
 class Comment(models.Model):
     text = models.TextField(
@@ -72,13 +245,85 @@ class Comment(models.Model):
         verbose_name='Автор комментария',
         related_name='comments',
     )
+    parent = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True,
+        verbose_name='Ответ на комментарий',
+        related_name='replies',
+    )
+    thread = models.PositiveIntegerField(
+        'Ветка',
+        null=True,
+        editable=False,
+        help_text='id корневого комментария ветки',
+    )
+    path = models.CharField(
+        'Путь в ветке',
+        max_length=PATH_SEGMENT * MAX_THREAD_DEPTH,
+        blank=True,
+        editable=False,
+    )
+    writebehind_id = models.CharField(
+        'Операция отложенной записи',
+        max_length=32,
+        null=True,
+        blank=True,
+        unique=True,
+        editable=False,
+        help_text='id операции posts.writebehind, записавшей комментарий',
+    )
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         ordering = ['-created']
+        indexes = [
+            models.Index(
+                fields=['post', '-created'],
+                name='comment_post_created_idx'
+            ),
+            models.Index(
+                fields=['thread', 'path'],
+                name='comment_thread_path_idx'
+            ),
+            models.Index(
+                fields=['path'],
+                name='comment_path_idx'
+            ),
+        ]
 
     def __str__(self):
         return self.text
 
+    @property
+    def depth(self):
+        return max(len(self.path) // PATH_SEGMENT - 1, 0)
+
+    def save(self, *args, **kwargs):
+        placing = self._state.adding and not self.path
+        prefix, thread = '', None
+        if placing and self.parent_id is not None:
+            prefix, thread = self.parent.path, self.parent.thread
+            if len(prefix) >= PATH_SEGMENT * MAX_THREAD_DEPTH:
+                # Глубже путь не поместится в поле: ответ встаёт в ветку
+                # рядом с родителем.
+                prefix = prefix[:-PATH_SEGMENT]
+                self.parent = Comment.objects.get(
+                    pk=int(prefix[-PATH_SEGMENT:], 16))
+        if not placing:
+            return super().save(*args, **kwargs)
+        # Путь зависит от id, поэтому пишется вторым запросом; без
+        # транзакции сбой между ними оставил бы комментарий с пустым
+        # путём, который roots() принял бы за корень.
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.path = prefix + path_segment(self.pk)
+            self.thread = thread or self.pk
+            Comment.objects.filter(pk=self.pk).update(
+                path=self.path, thread=self.thread)
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -100,7 +345,83 @@ class Follow(models.Model):
                 check=~models.Q(user=models.F("author")),
                 name='check_not_self_follow'
             ),
+            models.UniqueConstraint(
+                fields=['user', 'author'],
+                name='unique_follow'
+            ),
         ]
 
     def __str__(self):
         return self.text
+
+
+class FeedEntry(models.Model):
+    """Запись материализованной ленты подписок.
+
+    Строки раскладываются по подписчикам при публикации поста, поэтому
+    чтение ленты /follow/ сводится к диапазону по индексу (user, pub_date).
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Подписчик',
+        related_name='feed_entries',
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        verbose_name='Пост',
+        related_name='feed_entries',
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        ordering = ['-pub_date']
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'],
+                name='unique_feed_entry'
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date'],
+                name='feed_user_pub_date_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.post_id}'
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые иначе считались бы COUNT(*).
+
+    Поддерживаются сигналами posts.signals, расхождения исправляет
+    команда reconcile_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        verbose_name='Пользователь',
+        related_name='stats',
+    )
+    posts_count = models.PositiveIntegerField('Постов', default=0)
+    comments_count = models.PositiveIntegerField('Комментариев', default=0)
+    followers_count = models.PositiveIntegerField('Подписчиков', default=0)
+    following_count = models.PositiveIntegerField('Подписок', default=0)
+    feed_on_read = models.BooleanField(
+        'Посты подмешиваются в ленты при чтении',
+        default=False,
+        help_text='Посты автора раскладывались не во все ленты подписок',
+    )
+
+    class Meta:
+        verbose_name = 'Счётчики пользователя'
+        verbose_name_plural = 'Счётчики пользователей'
+
+    def __str__(self):
+        return str(self.user_id)
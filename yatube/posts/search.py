@@ -0,0 +1,98 @@
+# posts/search.py
+"""Полнотекстовый поиск по постам.
+
+На SQLite посты индексируются в виртуальной таблице FTS5 posts_post_fts
+(rowid — id поста), на PostgreSQL — GIN-индексом по to_tsvector.
+Индекс FTS5 поддерживается сигналами: миграции SQLite пересоздают
+таблицу posts_post и потеряли бы триггеры. Массовые вставки мимо ORM
+нужно дополнять командой rebuild_search_index.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+
+FTS_TABLE = 'posts_post_fts'
+
+WORD = re.compile(r'\w+')
+
+
+def is_fts5():
+    return connection.vendor == 'sqlite'
+
+
+def is_postgresql():
+    return connection.vendor == 'postgresql'
+
+
+def fts5_match(text):
+    """Строка MATCH для FTS5: все слова, каждое как префикс."""
+    return ' '.join(f'"{word}"*' for word in WORD.findall(text.lower()))
+
+
+def matching(queryset, text):
+    """Посты queryset, подходящие под запрос, без сортировки."""
+    if is_fts5():
+        match = fts5_match(text)
+        if not match:
+            return queryset.none()
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = posts_post.id',
+                   f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        )
+    if is_postgresql():
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+        return queryset.annotate(
+            search=SearchVector('text', config=settings.SEARCH_CONFIG),
+        ).filter(search=SearchQuery(text, config=settings.SEARCH_CONFIG))
+    return queryset.filter(text__icontains=text)
+
+
+def ranked(queryset, text):
+    """Посты queryset, подходящие под запрос, от самых релевантных."""
+    found = matching(queryset, text)
+    if is_fts5():
+        # rank в FTS5 — это bm25(), и чем он меньше, тем лучше.
+        return found.extra(
+            select={'rank': f'{FTS_TABLE}.rank'},
+            order_by=['rank', '-pub_date'],
+        )
+    if is_postgresql():
+        from django.contrib.postgres.search import SearchQuery, SearchRank
+        query = SearchQuery(text, config=settings.SEARCH_CONFIG)
+        return found.annotate(
+            rank=SearchRank(F('search'), query),
+        ).order_by('-rank', '-pub_date')
+    return found
+
+
+def index_post(post):
+    if not is_fts5():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post.pk])
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) VALUES (%s, %s)',
+            [post.pk, post.text],
+        )
+
+
+def unindex_post(post_id):
+    if not is_fts5():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [post_id])
+
+
+def rebuild_index():
+    if not is_fts5():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {FTS_TABLE}')
+        cursor.execute(
+            f'INSERT INTO {FTS_TABLE} (rowid, text) '
+            f'SELECT id, text FROM posts_post'
+        )
@@ -0,0 +1,240 @@
+# posts/seeding.py
+"""Генерация больших воспроизводимых наборов данных для замеров.
+
+Строки вставляются bulk_create пачками и без сигналов, поэтому
+производные данные (пути веток комментариев, счётчики, ленты
+подписок, индекс поиска, кеш лент) после вставки нужно пересобрать:
+см. rebuild_derived().
+
+Популярность пользователей распределена по степенному закону: у
+автора с рангом r вес 1 / r ** skew. По этим весам выбираются авторы
+подписок, авторы постов (с вдвое меньшей крутизной) и посты для
+комментариев, так что несколько авторов получают основную часть
+подписчиков, как в живом сервисе.
+"""
+import itertools
+import multiprocessing
+import random
+from array import array
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from . import counters, feeds, search
+from .models import Comment, Follow, Group, Post, User
+
+WORDS = (
+    'день ночь город дом друг книга кот собака море лес дорога окно '
+    'утро вечер работа музыка кино поезд чай кофе снег дождь солнце '
+    'новый старый большой маленький добрый тихий быстрый весёлый '
+    'смотреть читать писать думать гулять ехать ждать любить помнить '
+    'сегодня завтра вчера здесь там опять снова очень совсем уже'
+).split()
+
+
+def power_law_weights(count, skew):
+    """Накопленные веса 1 / r ** skew для random.choices."""
+    return list(itertools.accumulate(
+        1 / rank ** skew for rank in range(1, count + 1)))
+
+
+def sentence(rnd, words=12):
+    return ' '.join(rnd.choices(WORDS, k=rnd.randint(3, words))).capitalize()
+
+
+@contextmanager
+def explicit_dates():
+    """Позволяет задать pub_date и created при вставке.
+
+    Иначе auto_now_add перезаписал бы их текущим временем, и все посты
+    оказались бы опубликованы в одну секунду.
+    """
+    fields = [Post._meta.get_field('pub_date'),
+              Comment._meta.get_field('created')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+def chunks(total, size):
+    """Диапазоны (начало, конец) по size строк."""
+    return [(start, min(start + size, total))
+            for start in range(0, total, size)]
+
+
+# Seeder текущего этапа: дочерние процессы получают его при fork, а не
+# через pickle.
+_seeder = None
+
+
+def _run_job(args):
+    method, job = args
+    getattr(_seeder, method)(job)
+    connection.close()
+
+
+class Seeder:
+    """Наполняет базу; параметры задаёт команда seed_yatube."""
+
+    def __init__(self, users, groups, posts, comments, follows,
+                 skew=1.1, days=365, seed=0, batch_size=1000, workers=1,
+                 prefix='seed_', log=None):
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.comments = comments
+        self.follows = follows
+        self.skew = skew
+        self.days = days
+        self.seed = seed
+        self.batch_size = batch_size
+        self.workers = workers
+        self.prefix = prefix
+        self.log = log or (lambda message: None)
+        self.now = timezone.now()
+
+    def random(self, stage, job=0):
+        # Своя последовательность у каждой пачки: результат не зависит
+        # от числа процессов и порядка их работы.
+        return random.Random(f'{self.seed}:{stage}:{job}')
+
+    def random_date(self, rnd):
+        return self.now - timedelta(seconds=rnd.uniform(0, self.days * 86400))
+
+    def ids(self, queryset):
+        return array('q', queryset.order_by('pk').values_list(
+            'pk', flat=True).iterator())
+
+    # Пачки для bulk_create Django режет сам под ограничения базы
+    # (у SQLite — 500 строк на запрос), batch_size задаёт размер задания.
+
+    def seed_all(self):
+        self.seed_users()
+        self.seed_groups()
+        self.user_ids = self.ids(
+            User.objects.filter(username__startswith=self.prefix))
+        self.group_ids = self.ids(
+            Group.objects.filter(slug__startswith=self.prefix.rstrip('_')))
+        self.popularity = power_law_weights(len(self.user_ids), self.skew)
+        self.activity = power_law_weights(len(self.user_ids), self.skew / 2)
+        self.stage('Подписки', 'follows_job', len(self.user_ids))
+        self.stage('Посты', 'posts_job', self.posts)
+        self.post_ids = self.ids(Post.objects.filter(
+            author__username__startswith=self.prefix))
+        self.post_weights = power_law_weights(len(self.post_ids), self.skew)
+        self.stage('Комментарии', 'comments_job', self.comments)
+
+    def stage(self, title, method, total):
+        """Выполняет метод для каждой пачки, при workers > 1 — в
+        нескольких процессах."""
+        global _seeder
+        if not total:
+            return
+        self.log(f'{title}: {total}')
+        jobs = chunks(total, self.batch_size)
+        if self.workers <= 1 or len(jobs) <= 1:
+            for job in jobs:
+                getattr(self, method)(job)
+            return
+        # Дочерние процессы открывают свои соединения: унаследованные от
+        # родителя использовать нельзя.
+        connections.close_all()
+        _seeder = self
+        context = multiprocessing.get_context('fork')
+        try:
+            with context.Pool(self.workers) as pool:
+                pool.map(_run_job, [(method, job) for job in jobs])
+        finally:
+            _seeder = None
+
+    def seed_users(self):
+        self.log(f'Пользователи: {self.users}')
+        password = make_password(None)
+        rnd = self.random('users')
+        for start, end in chunks(self.users, self.batch_size):
+            User.objects.bulk_create(
+                (User(username=f'{self.prefix}{i}', password=password,
+                      first_name=rnd.choice(WORDS).capitalize(),
+                      date_joined=self.random_date(rnd))
+                 for i in range(start, end)),
+                ignore_conflicts=True,
+            )
+
+    def seed_groups(self):
+        slug = self.prefix.rstrip('_')
+        Group.objects.bulk_create(
+            (Group(title=f'Группа {i}', slug=f'{slug}-{i}',
+                   description=sentence(self.random('groups', i)))
+             for i in range(self.groups)),
+            ignore_conflicts=True,
+        )
+
+    def follows_job(self, job):
+        start, end = job
+        rnd = self.random('follows', start)
+        edges = []
+        for follower in self.user_ids[start:end]:
+            count = min(int(rnd.expovariate(1 / self.follows)),
+                        len(self.user_ids) - 1) if self.follows else 0
+            authors = set(rnd.choices(self.user_ids,
+                                      cum_weights=self.popularity, k=count))
+            authors.discard(follower)
+            edges += (Follow(user_id=follower, author_id=author)
+                      for author in authors)
+        Follow.objects.bulk_create(edges, ignore_conflicts=True)
+
+    def posts_job(self, job):
+        start, end = job
+        rnd = self.random('posts', start)
+        groups = list(self.group_ids) + [None] * max(len(self.group_ids), 1)
+        authors = rnd.choices(self.user_ids, cum_weights=self.activity,
+                              k=end - start)
+        with explicit_dates():
+            Post.objects.bulk_create(
+                (Post(text=sentence(rnd, 40), author_id=author,
+                      group_id=rnd.choice(groups),
+                      pub_date=self.random_date(rnd))
+                 for author in authors)
+            )
+
+    def comments_job(self, job):
+        start, end = job
+        if not self.post_ids:
+            return
+        rnd = self.random('comments', start)
+        posts = rnd.choices(self.post_ids, cum_weights=self.post_weights,
+                            k=end - start)
+        with explicit_dates():
+            Comment.objects.bulk_create(
+                (Comment(text=sentence(rnd), post_id=post,
+                         author_id=rnd.choice(self.user_ids),
+                         created=self.random_date(rnd))
+                 for post in posts)
+            )
+
+
+def rebuild_derived(log=None):
+    """Пересобирает всё, что при вставке мимо сигналов не обновилось."""
+    log = log or (lambda message: None)
+    log('Ветки комментариев')
+    Comment.objects.place_roots()
+    log('Счётчики')
+    counters.reconcile()
+    log('Ленты подписок')
+    with transaction.atomic():
+        feeds.rebuild_all_timelines()
+    log('Индекс поиска')
+    with transaction.atomic():
+        search.rebuild_index()
+    # Поколения лент после очистки начнутся заново, так что старые
+    # фрагменты и ETag не совпадут с новыми.
+    log('Кеш')
+    cache.clear()
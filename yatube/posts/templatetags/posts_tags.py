@@ -0,0 +1,149 @@
+# posts/templatetags/posts_tags.py
+from functools import lru_cache
+from urllib.parse import quote
+
+from django import template
+from django.urls import get_script_prefix, get_urlconf, reverse
+from django.utils.safestring import mark_safe
+
+from posts import caching
+from posts.utils import CURSOR_PARAM, PAGE_PARAM
+
+register = template.Library()
+
+
+class FeedCacheNode(template.Node):
+    def __init__(self, nodelist, scope, obj_id):
+        self.nodelist = nodelist
+        self.scope = scope
+        self.obj_id = obj_id
+
+    def render(self, context):
+        scope = self.scope.resolve(context)
+        obj_id = self.obj_id.resolve(context) if self.obj_id else None
+        request = context.get('request')
+        params = request.GET if request is not None else {}
+        key = caching.fragment_key(scope, obj_id, (
+            params.get(PAGE_PARAM, ''), params.get(CURSOR_PARAM, '')))
+        value = caching.get_fragment(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            caching.set_fragment(key, value)
+        return value
+
+
+@register.tag
+def feedcache(parser, token):
+    """Кеширует фрагмент ленты до изменения её постов.
+
+    {% feedcache 'index' %} ... {% endfeedcache %}
+    {% feedcache 'group' group.pk %} ... {% endfeedcache %}
+    """
+    bits = token.split_contents()
+    if len(bits) not in (2, 3):
+        raise template.TemplateSyntaxError(
+            f"'{bits[0]}' принимает ленту и, необязательно, id объекта")
+    nodelist = parser.parse(('endfeedcache',))
+    parser.delete_first_token()
+    scope = parser.compile_filter(bits[1])
+    obj_id = parser.compile_filter(bits[2]) if len(bits) == 3 else None
+    return FeedCacheNode(nodelist, scope, obj_id)
+
+
+CARD_TEMPLATE = 'includes/article.html'
+# Ключ render_context с карточками от {% prefetch_cards %}.
+CARDS = 'post_cards'
+# Подходит под конвертеры int, slug и str, поэтому годится как
+# аргумент любого из маршрутов карточки.
+URL_PLACEHOLDER = '9' * 12
+# Как в django.urls.resolvers: аргументы экранируются так же.
+URL_SAFE = "!$&'()*+,;=/~:@"
+
+
+@lru_cache(maxsize=64)
+def url_template(name, urlconf, prefix):
+    """Части URL маршрута name до и после его единственного аргумента.
+
+    urlconf и prefix (SCRIPT_NAME) входят в ключ кеша: от них зависит
+    результат reverse().
+    """
+    head, _, tail = reverse(
+        name, urlconf=urlconf, args=[URL_PLACEHOLDER]).partition(
+        URL_PLACEHOLDER)
+    return head, tail
+
+
+def fast_reverse(name, arg):
+    """reverse() для маршрута с одним аргументом без разбора шаблонов
+    маршрутов на каждом вызове."""
+    head, tail = url_template(name, get_urlconf(), get_script_prefix())
+    return head + quote(str(arg), safe=URL_SAFE) + tail
+
+
+def render_card(context, post, hide_author_link, hide_group_link):
+    card = context.render_context.get(CARD_TEMPLATE)
+    if card is None:
+        card = context.template.engine.get_template(CARD_TEMPLATE)
+        context.render_context[CARD_TEMPLATE] = card
+    values = {
+        'post_url': fast_reverse('posts:post_detail', post.pk),
+        'author_url': (
+            None if hide_author_link
+            else fast_reverse('posts:profile', post.author.username)),
+        'group_url': (
+            fast_reverse('posts:group_posts', post.group.slug)
+            if post.group_id and not hide_group_link else None),
+    }
+    # Обычно пост и так лежит в переменной цикла post.
+    if context.get('post') is not post:
+        values['post'] = post
+    with context.push(values):
+        # _render(), а не render(): render() заводит новый
+        # render_context, и вложенные шаблоны карточки искались бы
+        # заново для каждого поста.
+        return card._render(context)
+
+
+@register.simple_tag(takes_context=True)
+def prefetch_cards(context, posts, hide_author_link=False,
+                   hide_group_link=False):
+    """Достаёт карточки постов страницы из кеша одним get_many.
+
+    {% prefetch_cards page_obj hide_group_link=True %}
+
+    Недостающие карточки рендерятся тут же и кладутся в кеш одним
+    set_many; {% post_card %} в цикле ниже берёт готовый HTML. Флаги
+    должны совпадать с флагами post_card.
+    """
+    flags = (hide_author_link, hide_group_link)
+    keys = {caching.card_key(post, *flags): post for post in posts}
+    cards = caching.get_cards(list(keys))
+    missing = {key: render_card(context, post, *flags)
+               for key, post in keys.items() if key not in cards}
+    caching.set_cards(missing)
+    cards.update(missing)
+    context.render_context[CARDS] = {
+        (post.pk, flags): cards[key] for key, post in keys.items()}
+    return ''
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post, hide_author_link=False, hide_group_link=False):
+    """Карточка поста ленты вместо {% include 'includes/article.html' %}.
+
+    {% for post in page_obj %}{% post_card post hide_author_link=True %}
+
+    Шаблон карточки ищется один раз на страницу, контекст не копируется,
+    а ссылки строятся из заранее развёрнутых маршрутов. HTML карточки
+    кешируется по версии поста (posts.caching.card_key); без
+    {% prefetch_cards %} каждая карточка читается из кеша отдельно.
+    """
+    flags = (hide_author_link, hide_group_link)
+    html = context.render_context.get(CARDS, {}).get((post.pk, flags))
+    if html is None:
+        key = caching.card_key(post, *flags)
+        html = caching.get_cards([key]).get(key)
+        if html is None:
+            html = render_card(context, post, *flags)
+            caching.set_cards({key: html})
+    return mark_safe(html)
@@ -1,12 +1,17 @@
 # posts/tests/test_forms.py
 import shutil
 import tempfile
+from io import BytesIO, StringIO
 
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
+from PIL import Image
+from posts import thumbnails
 from posts.forms import PostForm
 from posts.models import Comment, Group, Post
 
@@ -68,7 +73,7 @@ class PostFormTests(TestCase):
             follow=True
         )
         self.assertEqual(Post.objects.count(), posts_count + 1)
-        self.assertEqual(response.context['post'], self.post)
+        self.assertIn(self.post, response.context['page_obj'])
 
     def test_post_form_edition(self):
         """Валидная форма создает отредактированную запись."""
@@ -105,6 +110,103 @@ class PostFormTests(TestCase):
             ).exists()
         )
 
+    def test_concurrent_edit_is_not_overwritten(self):
+        """Правка по устаревшей версии не затирает чужую и даёт 409."""
+        url = reverse('posts:post_edit', kwargs={'post_id': self.post.pk})
+        version = self.authorized_client.get(url).context['version']
+        response = self.authorized_client.post(
+            url, {'text': 'Первая правка', 'version': version})
+        self.assertEqual(response.status_code, 302)
+        response = self.authorized_client.post(
+            url, {'text': 'Вторая правка', 'version': version})
+        self.assertEqual(response.status_code, 409)
+        self.assertContains(response, 'Пост изменили', status_code=409)
+        self.assertContains(response, 'Вторая правка', status_code=409)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Первая правка')
+        self.assertEqual(response.context['version'], self.post.version)
+        response = self.authorized_client.post(
+            url, {'text': 'Вторая правка',
+                  'version': response.context['version']})
+        self.assertEqual(response.status_code, 302)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Вторая правка')
+
+    def test_thumbnails_do_not_cause_edit_conflict(self):
+        """Готовые миниатюры не меняют версию, открытую автором в форме."""
+        url = reverse('posts:post_edit', kwargs={'post_id': self.post.pk})
+        version = self.authorized_client.get(url).context['version']
+        thumbnails.store(self.post.pk, self.post.image.name,
+                         {'thumbnail': 'posts/variants/thumb.jpg'})
+        response = self.authorized_client.post(
+            url, {'text': 'Правка после миниатюр', 'version': version})
+        self.assertEqual(response.status_code, 302)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.text, 'Правка после миниатюр')
+        self.assertEqual(self.post.thumbnail, 'posts/variants/thumb.jpg')
+
+    @override_settings(THUMBNAIL_ASYNC=False)
+    def test_post_thumbnail_prepared_in_background(self):
+        """Пока миниатюра не готова, выводится оригинал, потом — варианты."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="{self.post.image.url}"')
+        self.assertNotContains(response, '<source')
+        thumbnails.generate(self.post.pk, self.post.image.name)
+        self.post.refresh_from_db()
+        self.assertTrue(self.post.thumbnail)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="{self.post.thumbnail}"')
+        self.assertContains(response, '<source type="image/webp"')
+
+    def test_generate_thumbnails_command_makes_responsive_variants(self):
+        """Команда нарезает картинку по ширинам и форматам."""
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG')
+        post = Post.objects.create(
+            author=self.user,
+            text='Большая картинка',
+            image=SimpleUploadedFile('big.jpg', buffer.getvalue(),
+                                     content_type='image/jpeg'),
+        )
+        call_command('generate_thumbnails', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, default_storage.url(
+            thumbnails.variant_name(post.pk, post.image.name, 960, 'JPEG')))
+        for width in thumbnails.WIDTHS:
+            for fmt in ('WEBP', 'JPEG'):
+                name = thumbnails.variant_name(post.pk, post.image.name,
+                                               width, fmt)
+                self.assertTrue(default_storage.exists(name), name)
+                self.assertIn(f'{default_storage.url(name)} {width}w',
+                              post.image_variants)
+        with default_storage.open(thumbnails.variant_name(
+                post.pk, post.image.name, 640, 'WEBP')) as file:
+            self.assertEqual(Image.open(file).size, (640, 226))
+
+    def test_thumbnails_do_not_touch_other_posts_files(self):
+        """Варианты картинок с одним именем у разных постов не
+        совпадают, а загрузка с именем как у варианта не удаляется."""
+        posts = []
+        for name, fmt, color in (('same.jpg', 'JPEG', 'red'),
+                                 ('same.png', 'PNG', 'blue'),
+                                 ('same_320w.png', 'PNG', 'green')):
+            buffer = BytesIO()
+            Image.new('RGB', (400, 200), color).save(buffer, fmt)
+            posts.append(Post.objects.create(
+                author=self.user, text=name,
+                image=SimpleUploadedFile(name, buffer.getvalue())))
+        for post in posts:
+            thumbnails.generate(post.pk, post.image.name)
+            post.refresh_from_db()
+        first, second, upload = posts
+        self.assertNotEqual(first.thumbnail, second.thumbnail)
+        self.assertTrue(default_storage.exists(upload.image.name))
+        with default_storage.open(thumbnails.variant_name(
+                first.pk, first.image.name, 320, 'JPEG')) as file:
+            red, _, blue = Image.open(file).convert('RGB').getpixel((0, 0))
+        self.assertGreater(red, blue)
+
     def test_create_comment_authorized_only(self):
         """Комментирует только авторизованный пользователь"""
         comments_count = Comment.objects.count()
@@ -121,3 +223,32 @@ class PostFormTests(TestCase):
         self.assertEqual(comment.post_id, self.post.id)
         self.assertRedirects(response, reverse(
             'posts:post_detail', args={self.post.id}))
+
+    def test_reply_to_comment(self):
+        """Ответ встаёт в ветку сразу под комментарием, на который
+        отвечают."""
+        root = Comment.objects.create(post=self.post, author=self.user,
+                                      text='Вопрос')
+        later = Comment.objects.create(post=self.post, author=self.user,
+                                       text='Другая ветка')
+        url = reverse('posts:add_comment', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.post(
+            url, {'text': 'Ответ', 'parent': root.pk}, follow=True)
+        reply = Comment.objects.latest('id')
+        self.assertEqual(reply.parent, root)
+        self.assertContains(response, f'?reply={root.pk}#comment-form')
+        self.assertEqual(list(response.context['comments']),
+                         [later, root, reply])
+        other_post = Post.objects.create(author=self.user, text='Другой')
+        alien = Comment.objects.create(post=other_post, author=self.user,
+                                       text='Чужой')
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', args=[self.post.pk]),
+            {'reply': root.pk})
+        self.assertContains(
+            response, f'<input type="hidden" name="parent" value="{root.pk}">')
+        for parent in (alien.pk, 'x'):
+            with self.subTest(parent=parent):
+                response = self.authorized_client.post(
+                    url, {'text': 'Ответ', 'parent': parent})
+                self.assertEqual(response.status_code, 404)
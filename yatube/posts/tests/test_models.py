@@ -1,8 +1,14 @@
 # posts/tests/test_models.py
+from io import StringIO
+from unittest import mock
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import DatabaseError
 from django.test import TestCase
 
-from ..models import Group, Post
+from ..models import (MAX_THREAD_DEPTH, Comment, Follow, Group, Post,
+                      UserStats)
 
 User = get_user_model()
 
@@ -31,3 +37,135 @@ class PostModelTest(TestCase):
         group = PostModelTest.group
         expected_object_name = group.title
         self.assertEqual(expected_object_name, str(group.title))
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def stats(self, user):
+        return UserStats.objects.get(user=user)
+
+    def test_counters_follow_creates_and_deletes(self):
+        """Счётчики меняются при создании и удалении записей."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.author).followers_count, 1)
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+        self.assertEqual(self.stats(self.reader).following_count, 1)
+
+        follow.delete()
+        post.delete()
+        self.assertEqual(self.stats(self.author).posts_count, 0)
+        self.assertEqual(self.stats(self.author).followers_count, 0)
+        self.assertEqual(self.stats(self.reader).comments_count, 0)
+        self.assertEqual(self.stats(self.reader).following_count, 0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        """Команда reconcile_counters исправляет разошедшиеся счётчики."""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.create(post=post, author=self.reader, text='Ок')
+        UserStats.objects.filter(user=self.author).update(posts_count=7)
+        UserStats.objects.filter(user=self.reader).delete()
+        Post.objects.filter(pk=post.pk).update(comments_count=0)
+
+        call_command('reconcile_counters', stdout=StringIO())
+
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        self.assertEqual(self.stats(self.author).posts_count, 1)
+        self.assertEqual(self.stats(self.reader).comments_count, 1)
+
+
+class CommentThreadTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='auth')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+
+    def reply(self, parent, text):
+        return Comment.objects.create(post=self.post, author=self.user,
+                                      parent=parent, text=text)
+
+    def test_subtree_is_read_in_thread_order(self):
+        """Поддерево читается одним запросом в порядке обхода ветки."""
+        root = self.reply(None, 'корень')
+        first = self.reply(root, 'первый')
+        second = self.reply(root, 'второй')
+        nested = self.reply(first, 'вложенный')
+        other = self.reply(None, 'другая ветка')
+        self.assertEqual((root.thread, nested.thread), (root.pk, root.pk))
+        self.assertEqual((root.depth, first.depth, nested.depth), (0, 1, 2))
+        with self.assertNumQueries(1):
+            self.assertEqual(list(Comment.objects.subtree(root)),
+                             [root, first, nested, second])
+        self.assertEqual(list(Comment.objects.subtree(first)),
+                         [first, nested])
+        roots = Comment.objects.roots().with_replies_cutoff(1)
+        self.assertEqual(
+            {root.pk: root.replies_cutoff for root in roots},
+            {root.pk: nested.path, other.pk: None})
+        self.assertEqual(list(Comment.objects.replies_before_cutoff(roots)),
+                         [first])
+        root.delete()
+        self.assertEqual(list(Comment.objects.all()), [other])
+
+    def test_comment_without_path_is_not_saved(self):
+        """Сбой при записи пути откатывает и сам комментарий."""
+        root = self.reply(None, 'корень')
+        with mock.patch('django.db.models.QuerySet.update',
+                        side_effect=DatabaseError):
+            with self.assertRaises(DatabaseError):
+                self.reply(root, 'ответ')
+        self.assertEqual(list(Comment.objects.all()), [root])
+
+    def test_replies_below_max_depth_join_the_parent_level(self):
+        """Ответ глубже MAX_THREAD_DEPTH встаёт рядом с родителем."""
+        comment = None
+        for level in range(MAX_THREAD_DEPTH + 1):
+            comment = self.reply(comment, f'уровень {level}')
+        self.assertEqual(comment.depth, MAX_THREAD_DEPTH - 1)
+        self.assertEqual(comment.parent.depth, MAX_THREAD_DEPTH - 2)
+
+    def test_place_roots(self):
+        """Вставленные мимо save() комментарии становятся корнями."""
+        Comment.objects.bulk_create([
+            Comment(post=self.post, author=self.user, text='без пути')])
+        self.assertEqual(Comment.objects.place_roots(), 1)
+        comment = Comment.objects.get()
+        self.assertEqual(comment.thread, comment.pk)
+        self.assertEqual(list(Comment.objects.subtree(comment)), [comment])
+
+
+class SeedCommandTest(TestCase):
+    def test_seed_yatube_builds_consistent_dataset(self):
+        """seed_yatube наполняет базу и пересобирает производные данные."""
+        call_command('seed_yatube', users=60, groups=3, posts=300,
+                     comments=200, follows=5, batch_size=50,
+                     stdout=StringIO())
+        self.assertEqual(User.objects.count(), 60)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 200)
+        self.assertGreater(
+            Post.objects.dates('pub_date', 'day').count(), 1)
+        # Популярность по степенному закону: первый автор заметно
+        # популярнее среднего.
+        followers = list(UserStats.objects.order_by(
+            '-followers_count').values_list('followers_count', flat=True))
+        self.assertGreater(followers[0], 3 * followers[len(followers) // 2])
+        out = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('пользователи — 0, посты — 0', out.getvalue())
+        follow = Follow.objects.first()
+        self.assertTrue(follow.user.feed_entries.filter(
+            post__author=follow.author).exists())
+        self.assertFalse(Comment.objects.filter(path='').exists())
@@ -1,17 +1,35 @@
 # posts/tests/test_views.py
+import json
+import os
+import shutil
+import tempfile
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
 from django.conf import settings as s
 from django.contrib.auth import get_user_model
 from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import Client, TestCase
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from posts.models import Follow, Group, Post
+from django.utils import timezone
+from posts import caching, writebehind
+from posts.models import (Comment, FeedEntry, Follow, Group, Post,
+                          UserStats)
 
 from ..forms import PostForm
+from ..templatetags.posts_tags import fast_reverse
 
 User = get_user_model()
 
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=s.BASE_DIR)
+
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostViewTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -55,6 +73,11 @@ class PostViewTests(TestCase):
                     cls.post.pk}): 'posts/post_create.html',
         }
 
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
     def setUp(self):
         self.guest_client = Client()
         self.authorized_client = Client()
@@ -62,16 +85,40 @@ class PostViewTests(TestCase):
         cache.clear()
 
     def test_index_page_cache(self):
+        """Главная кешируется и сбрасывается при изменении постов."""
         new_post = Post.objects.create(author=self.user, text='Тест кеш')
         response = self.authorized_client.get(reverse('posts:index'))
         self.assertContains(response, new_post.text)
-        new_post.delete()
+        stats = caching.cache_stats()
         response = self.guest_client.get(reverse('posts:index'))
         self.assertContains(response, new_post.text)
-        cache.clear()
+        self.assertEqual(caching.cache_stats()['hits'], stats['hits'] + 1)
+        new_post.delete()
         response = self.guest_client.get(reverse('posts:index'))
         self.assertNotContains(response, new_post.text)
 
+    @override_settings(CACHE_SHARED=False, FEED_CACHE_LOCAL_TIMEOUT=30)
+    def test_fragments_expire_soon_without_shared_cache(self):
+        """Без общего кеша фрагменты лент хранятся недолго."""
+        with mock.patch('posts.caching.cache') as fake_cache:
+            caching.set_fragment('feed:frag:test', 'html')
+        fake_cache.set.assert_called_once_with('feed:frag:test', 'html', 30)
+
+    def test_group_page_cache_follows_post_group(self):
+        """Перенос поста в другую группу сбрасывает обе ленты групп."""
+        other_group = Group.objects.create(
+            title='Другая группа', slug='other_slug', description='-')
+        post = Post.objects.create(
+            author=self.user, text='Переезжающий пост', group=self.group)
+        old_url = reverse('posts:group_posts', args=[self.group.slug])
+        new_url = reverse('posts:group_posts', args=[other_group.slug])
+        self.assertContains(self.guest_client.get(old_url), post.text)
+        self.assertNotContains(self.guest_client.get(new_url), post.text)
+        post.group = other_group
+        post.save()
+        self.assertNotContains(self.guest_client.get(old_url), post.text)
+        self.assertContains(self.guest_client.get(new_url), post.text)
+
     def test_view_uses_correct_template(self):
         """View функции использует соответствующий шаблон."""
         for reverse_name, template in self.pages_names_templates.items():
@@ -168,6 +215,145 @@ class PaginatorViewsTest(TestCase):
         self.assertEqual(len(response.context['page_obj']), 3)
 
 
+@override_settings(POSTS_CURSOR_PAGINATION=True)
+class CursorPaginatorViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author_user')
+        cls.posts = [
+            Post.objects.create(author=cls.user, text=f'Пост {i}')
+            for i in range(13)
+        ]
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_cursor_pages_walk_forward_and_back(self):
+        """Курсор ведёт на следующую страницу и обратно без пропусков."""
+        first = self.guest_client.get(reverse('posts:index'))
+        first_page = first.context['page_obj']
+        self.assertEqual(len(first_page), s.POSTS_Q)
+        self.assertFalse(first_page.has_previous())
+        self.assertTrue(first_page.has_next())
+
+        second = self.guest_client.get(
+            reverse('posts:index'), {'cursor': first_page.next_cursor})
+        second_page = second.context['page_obj']
+        self.assertEqual(len(second_page), 3)
+        self.assertFalse(second_page.has_next())
+        expected = sorted(self.posts, key=lambda post: (post.pub_date,
+                                                        post.pk),
+                          reverse=True)
+        self.assertEqual(list(first_page) + list(second_page), expected)
+
+        back = self.guest_client.get(
+            reverse('posts:index'), {'cursor': second_page.previous_cursor})
+        self.assertEqual(list(back.context['page_obj']), list(first_page))
+        self.assertFalse(back.context['page_obj'].has_previous())
+
+    def test_broken_cursor_opens_first_page(self):
+        """Испорченный курсор открывает первую страницу."""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(len(response.context['page_obj']), s.POSTS_Q)
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+    def test_cursor_pagination_skips_count_query(self):
+        """Курсорная пагинация не выполняет COUNT(*)."""
+        with CaptureQueriesContext(connection) as queries:
+            self.guest_client.get(reverse('posts:index'))
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertNotIn('COUNT(', sql.upper())
+        self.assertNotIn('OFFSET', sql.upper())
+
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentsWindowViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author_user')
+        cls.post = Post.objects.create(author=cls.user, text='Пост')
+        cls.comments = [
+            Comment.objects.create(post=cls.post, author=cls.user,
+                                   text=f'Комментарий {i}')
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.guest_client = Client()
+        cache.clear()
+
+    def test_post_detail_shows_latest_comments(self):
+        """Страница поста показывает только последние комментарии."""
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        comments = response.context['comments']
+        self.assertEqual(list(comments), self.comments[::-1][:2])
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, comments.next_cursor)
+
+    def test_fragments_load_the_rest(self):
+        """Фрагменты по курсору отдают остальные комментарии по порядку."""
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        seen = []
+        cursor = None
+        while True:
+            response = self.guest_client.get(
+                url, {'cursor': cursor} if cursor else {})
+            self.assertTemplateUsed(response,
+                                    'posts/includes/comments.html')
+            page = response.context['comments']
+            seen += page
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, self.comments[::-1])
+
+    def test_comments_window_query_count(self):
+        """Окно комментариев читается запросом корней веток и запросом
+        ответов вместе с авторами."""
+        url = reverse('posts:post_comments', args=[self.post.pk])
+        # Запрос поста для ETag, корни веток окна и ответы в них.
+        with self.assertNumQueries(3):
+            self.guest_client.get(url)
+        response = self.guest_client.get(url, {'cursor': 'broken'})
+        self.assertEqual(len(response.context['comments']), 2)
+        missing = reverse('posts:post_comments', args=[0])
+        self.assertEqual(self.guest_client.get(missing).status_code, 404)
+
+    @override_settings(COMMENT_REPLIES_PER_THREAD=2)
+    def test_long_thread_is_windowed(self):
+        """Из длинной ветки окно показывает первые ответы, остальные
+        подгружаются фрагментами."""
+        root = self.comments[-1]
+        replies = [
+            Comment.objects.create(post=self.post, author=self.user,
+                                   parent=root, text=f'Ответ {i}')
+            for i in range(5)
+        ]
+        response = self.guest_client.get(
+            reverse('posts:post_detail', args=[self.post.pk]))
+        window = list(response.context['comments'])
+        self.assertEqual(window[:3], [root, *replies[:2]])
+        self.assertTrue(window[2].more_replies)
+        url = reverse('posts:comment_replies', args=[self.post.pk, root.pk])
+        self.assertContains(response, f'{url}?after={replies[1].path}')
+        seen = replies[:2]
+        after = replies[1].path
+        while after:
+            with self.assertNumQueries(3):
+                response = self.guest_client.get(url, {'after': after})
+            page = response.context['comments']
+            seen += page
+            after = page[-1].path if page[-1].more_replies else None
+        self.assertEqual(seen, replies)
+        wrong_post = reverse('posts:comment_replies', args=[0, root.pk])
+        self.assertEqual(self.guest_client.get(wrong_post).status_code, 404)
+
+
 class FollowViewsTest(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -204,6 +390,15 @@ class FollowViewsTest(TestCase):
             user=self.user_unfol, author=self.author).exists()
         self.assertTrue(follower, 'Подписка не работает')
 
+    def test_follow_twice_keeps_single_row(self):
+        """Повторная подписка не создаёт второй записи."""
+        client = self.authorized_user_unfol_client
+        url = reverse('posts:profile_follow', args=[self.author.username])
+        client.get(url)
+        client.get(url)
+        self.assertEqual(Follow.objects.filter(
+            user=self.user_unfol, author=self.author).count(), 1)
+
     def test_unfollow(self):
         """Тест работы отписки от автора."""
         Follow.objects.create(user=self.user_fol,
@@ -229,3 +424,509 @@ class FollowViewsTest(TestCase):
         new_posts = response_new.context['page_obj']
         self.assertEqual(len(response_new.context['page_obj']), 0)
         self.assertNotIn(self.post, new_posts)
+
+    def test_follow_feed_is_materialized(self):
+        """Подписка и новый пост раскладываются в ленту, отписка чистит её."""
+        Follow.objects.create(user=self.user_fol, author=self.user_unfol)
+        new_post = Post.objects.create(text='Новый пост',
+                                       author=self.user_unfol)
+        self.assertEqual(
+            set(FeedEntry.objects.filter(user=self.user_fol)
+                .values_list('post_id', flat=True)),
+            {self.post.pk, new_post.pk},
+        )
+        Follow.objects.filter(user=self.user_fol).delete()
+        self.assertFalse(FeedEntry.objects.filter(user=self.user_fol).exists())
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=0)
+    def test_heavy_author_read_on_demand(self):
+        """Посты популярного автора подмешиваются в ленту при чтении."""
+        Follow.objects.create(user=self.user_fol, author=self.user_unfol)
+        Post.objects.create(text='Новый пост', author=self.user_unfol)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.authorized_user_fol_client.get(
+            reverse('posts:follow_index'))
+        self.assertEqual(len(response.context['page_obj']), 2)
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_author_back_under_fanout_limit_stays_in_feed(self):
+        """Посты, не разложенные, пока автор был популярен, остаются в
+        ленте и после того, как подписчиков стало меньше порога."""
+        Follow.objects.create(user=self.user_fol, author=self.user_unfol)
+        Follow.objects.create(user=self.author, author=self.user_unfol)
+        post = Post.objects.create(text='Новый пост', author=self.user_unfol)
+        Follow.objects.filter(user=self.user_fol).delete()
+        client = Client()
+        client.force_login(self.author)
+        response = client.get(reverse('posts:follow_index'))
+        self.assertIn(post, response.context['page_obj'])
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertFalse(UserStats.objects.get(
+            user=self.user_unfol).feed_on_read)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.author, post=post).exists())
+
+    def test_rebuild_timelines_command(self):
+        """Команда rebuild_timelines восстанавливает ленты."""
+        Follow.objects.create(user=self.user_fol, author=self.user_unfol)
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_timelines', stdout=StringIO())
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.user_fol, post=self.post).exists())
+
+
+class QueryCountViewsTest(TestCase):
+    """Число SQL-запросов страниц не зависит от числа постов на них."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create(username='reader')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание группы',
+        )
+        cls.authors = [
+            User.objects.create(username=f'author_{i}') for i in range(3)
+        ]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.reader, author=author)
+            for i in range(4):
+                cls.post = Post.objects.create(
+                    author=author, group=cls.group, text=f'Пост {i}')
+                cls.post.comments.create(author=cls.reader, text='Коммент')
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+        cache.clear()
+
+    def test_public_pages_query_count(self):
+        """Ленты и страница поста укладываются в фиксированное число
+        запросов."""
+        # Группе, профилю и посту нужен ещё запрос id для ETag, посту —
+        # ещё запрос ответов в ветках комментариев.
+        pages = {
+            reverse('posts:index'): 2,
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}): 4,
+            reverse('posts:profile',
+                    kwargs={'username': self.authors[0].username}): 4,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}): 4,
+        }
+        for page, queries in pages.items():
+            with self.subTest(page=page):
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(page)
+
+    def test_follow_index_query_count(self):
+        """Лента подписок укладывается в фиксированное число запросов."""
+        with self.assertNumQueries(5):
+            self.authorized_client.get(reverse('posts:follow_index'))
+
+
+class ConditionalGetViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author_user')
+        cls.reader = User.objects.create(username='reader_user')
+        cls.group = Group.objects.create(
+            title='Тестовая группа',
+            slug='test_slug',
+            description='Тестовое описание группы',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Тестовый пост')
+
+    def setUp(self):
+        cache.clear()
+        self.guest_client = Client()
+        self.authorized_client = Client()
+        self.authorized_client.force_login(self.reader)
+
+    def revalidate(self, client, url):
+        response = client.get(url)
+        return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        """Неизменившаяся страница отдаётся как 304 без запросов к постам."""
+        pages = {
+            reverse('posts:index'): 0,
+            reverse('posts:group_posts', kwargs={'slug': self.group.slug}): 1,
+            reverse('posts:profile',
+                    kwargs={'username': self.author.username}): 1,
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}): 1,
+        }
+        for page, queries in pages.items():
+            with self.subTest(page=page):
+                etag = self.guest_client.get(page)['ETag']
+                with self.assertNumQueries(queries):
+                    response = self.guest_client.get(
+                        page, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+
+    def test_last_modified(self):
+        """If-Modified-Since тоже даёт 304 для неизменившейся страницы."""
+        url = reverse('posts:index')
+        last_modified = self.guest_client.get(url)['Last-Modified']
+        response = self.guest_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_post_etag_follows_updated_at(self):
+        """ETag страницы поста меняется с updated_at, даже без сигналов."""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        etag = self.guest_client.get(url)['ETag']
+        Post.objects.filter(pk=self.post.pk).update(
+            text='Правка мимо сигналов', updated_at=timezone.now())
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Правка мимо сигналов')
+
+    def test_changes_invalidate_etag(self):
+        """Новый пост, комментарий или подписка меняют ETag страниц."""
+        index = reverse('posts:index')
+        detail = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        profile = reverse('posts:profile',
+                          kwargs={'username': self.author.username})
+        changes = (
+            (index, lambda: Post.objects.create(author=self.reader,
+                                                text='Новый пост')),
+            (detail, lambda: self.post.comments.create(author=self.reader,
+                                                       text='Коммент')),
+            (profile, lambda: Follow.objects.create(user=self.reader,
+                                                    author=self.author)),
+        )
+        for url, change in changes:
+            with self.subTest(url=url):
+                etag = self.authorized_client.get(url)['ETag']
+                change()
+                response = self.authorized_client.get(
+                    url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 200)
+
+    def test_etag_depends_on_user(self):
+        """Гость и пользователь получают разные ETag одной страницы."""
+        url = reverse('posts:index')
+        self.assertNotEqual(self.guest_client.get(url)['ETag'],
+                            self.authorized_client.get(url)['ETag'])
+        response = self.revalidate(self.authorized_client, url)
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('private', response['Cache-Control'])
+
+    @override_settings(CACHE_SHARED=False)
+    def test_no_validators_without_shared_cache(self):
+        """С кешем процесса страницы отдаются без ETag и 304."""
+        url = reverse('posts:index')
+        response = self.guest_client.get(url, HTTP_IF_NONE_MATCH='"x"')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('ETag', response)
+        self.assertNotIn('Last-Modified', response)
+
+
+class SearchViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='author_user')
+        cls.cats = Post.objects.create(
+            author=cls.user, text='Котики спасут мир, котики везде')
+        cls.dogs = Post.objects.create(
+            author=cls.user, text='Собаки и один котик')
+        Post.objects.create(author=cls.user, text='Про погоду')
+
+    def setUp(self):
+        self.guest_client = Client()
+
+    def search(self, query):
+        response = self.guest_client.get(reverse('posts:search'),
+                                         {'q': query})
+        return list(response.context['page_obj'])
+
+    def test_search_finds_posts_by_word_prefix(self):
+        """Поиск находит посты по началу слова, лучшие — первыми."""
+        self.assertEqual(self.search('котик'), [self.cats, self.dogs])
+        self.assertEqual(self.search('собаки котик'), [self.dogs])
+
+    def test_search_index_follows_edits_and_deletes(self):
+        """Индекс поиска обновляется при правке и удалении поста."""
+        self.dogs.text = 'Только собаки'
+        self.dogs.save()
+        self.assertEqual(self.search('котик'), [self.cats])
+        self.cats.delete()
+        self.assertEqual(self.search('котик'), [])
+
+    def test_search_ignores_query_syntax(self):
+        """Спецсимволы FTS5 в запросе не ломают поиск."""
+        self.assertEqual(self.search('"котики*" -('), [self.cats])
+        self.assertEqual(self.search('***'), [])
+
+
+class WriteBehindViewsTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create(username='author_user')
+        cls.reader = User.objects.create(username='reader_user')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+
+    def setUp(self):
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool, ignore_errors=True)
+        settings = override_settings(
+            WRITE_BEHIND=True, WRITE_BEHIND_ASYNC=False,
+            WRITE_BEHIND_SPOOL_DIR=spool,
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.addCleanup(writebehind.flush)
+        self.spool = spool
+        cache.clear()
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_comment_is_visible_to_author_before_flush(self):
+        """Комментарий пишется пачкой, но автор видит его сразу."""
+        url = reverse('posts:post_detail', args=[self.post.pk])
+        etag = self.reader_client.get(url)['ETag']
+        self.reader_client.post(
+            reverse('posts:add_comment', args=[self.post.pk]),
+            {'text': 'Отложенный'})
+        self.assertFalse(Comment.objects.exists())
+        self.assertTrue(os.listdir(self.spool))
+        response = self.reader_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Отложенный')
+        self.assertNotContains(self.guest_client.get(url), 'Отложенный')
+
+        self.assertEqual(writebehind.flush(), 1)
+        comment = Comment.objects.get()
+        self.assertEqual((comment.author, comment.text),
+                         (self.reader, 'Отложенный'))
+        self.assertEqual(comment.thread, comment.pk)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(writebehind.pending(self.reader.pk), [])
+        self.assertEqual(os.listdir(self.spool), [])
+        self.assertContains(self.guest_client.get(url), 'Отложенный')
+
+    def test_comments_keep_submission_time(self):
+        """Комментарии пачки датируются отправкой, а не сбросом."""
+        parent = Comment.objects.create(
+            post=self.post, author=self.author, text='Корень')
+        submitted = timezone.now() - timedelta(minutes=5)
+        with mock.patch('time.time', return_value=submitted.timestamp()):
+            for parent_id in (None, parent.pk):
+                writebehind.submit(writebehind.COMMENT, self.reader.pk,
+                                   post_id=self.post.pk, parent_id=parent_id,
+                                   text='Отложенный')
+        self.assertEqual(writebehind.flush(), 2)
+        for comment in Comment.objects.filter(text='Отложенный'):
+            self.assertEqual(comment.created, submitted)
+
+    def test_follow_ops_are_coalesced(self):
+        """Из подписок и отписок пачки записывается последняя."""
+        follow = reverse('posts:profile_follow',
+                         args=[self.author.username])
+        unfollow = reverse('posts:profile_unfollow',
+                           args=[self.author.username])
+        for url in (follow, unfollow, follow):
+            self.reader_client.get(url)
+        response = self.reader_client.get(
+            reverse('posts:profile', args=[self.author.username]))
+        self.assertTrue(response.context['following'])
+        self.assertFalse(Follow.objects.exists())
+        writebehind.flush()
+        self.assertTrue(Follow.objects.filter(
+            user=self.reader, author=self.author).exists())
+        self.assertEqual(UserStats.objects.get(
+            user=self.author).followers_count, 1)
+        self.assertTrue(FeedEntry.objects.filter(
+            user=self.reader, post=self.post).exists())
+
+    def test_concurrent_follow_is_counted_once(self):
+        """Подписка, вставленная параллельно с пачкой, считается один раз."""
+        bulk_create = Follow.objects.bulk_create
+
+        def racing_bulk_create(objs, **kwargs):
+            # Другой процесс успевает подписаться между проверкой и
+            # вставкой пачки.
+            Follow.objects.create(user=self.reader, author=self.author)
+            return bulk_create(objs, **kwargs)
+
+        writebehind.submit(writebehind.FOLLOW, self.reader.pk,
+                           author_id=self.author.pk)
+        with mock.patch.object(Follow.objects, 'bulk_create',
+                               racing_bulk_create):
+            writebehind.flush()
+        self.assertEqual(Follow.objects.count(), 1)
+        self.assertEqual(UserStats.objects.get(
+            user=self.author).followers_count, 1)
+        self.assertEqual(UserStats.objects.get(
+            user=self.reader).following_count, 1)
+
+    def test_spool_of_stopped_process_is_replayed_once(self):
+        """Спул упавшего процесса записывается, без повторов."""
+        op = {'id': 'a1', 'kind': writebehind.COMMENT,
+              'user_id': self.reader.pk, 'submitted': 0,
+              'post_id': self.post.pk, 'parent_id': None, 'text': 'Спул'}
+        path = os.path.join(self.spool, '999999999.jsonl')
+        for _ in range(2):
+            with open(path, 'w') as file:
+                file.write(json.dumps(op) + '\n{"id": "недописанная')
+            out = StringIO()
+            call_command('flush_write_behind', stdout=out)
+            self.assertIn('Записано операций: 1', out.getvalue())
+        self.assertEqual(Comment.objects.filter(text='Спул').count(), 1)
+
+    def test_spool_of_previous_process_with_same_pid_is_replayed(self):
+        """Спул прежнего процесса с тем же pid не принимается за свой."""
+        for name, text in ((f'{os.getpid()}_0ld0ld00.jsonl', 'Прежний'),
+                           (f'{os.getpid()}.jsonl', 'Старый формат')):
+            op = {'id': text, 'kind': writebehind.COMMENT,
+                  'user_id': self.reader.pk, 'submitted': 0,
+                  'post_id': self.post.pk, 'parent_id': None, 'text': text}
+            with open(os.path.join(self.spool, name), 'w') as file:
+                file.write(json.dumps(op) + '\n')
+        writebehind.submit(writebehind.COMMENT, self.reader.pk,
+                           post_id=self.post.pk, parent_id=None,
+                           text='Новый')
+        self.assertEqual(writebehind.flush(), 3)
+        self.assertEqual(
+            set(Comment.objects.values_list('text', flat=True)),
+            {'Прежний', 'Старый формат', 'Новый'})
+        self.assertEqual(os.listdir(self.spool), [])
+
+    def test_replay_keeps_repeated_comments(self):
+        """Два одинаковых комментария из спула записываются оба, а уже
+        записанная операция не повторяется."""
+        ops = [
+            {'id': op_id, 'kind': writebehind.COMMENT,
+             'user_id': self.reader.pk, 'submitted': 0,
+             'post_id': self.post.pk, 'parent_id': None, 'text': '+1'}
+            for op_id in ('b1', 'b2')
+        ]
+        writebehind.apply(ops[:1])
+        writebehind.apply(ops, replay=True)
+        self.assertEqual(list(Comment.objects.order_by('pk').values_list(
+            'writebehind_id', flat=True)), ['b1', 'b2'])
+
+    @override_settings(WRITE_BEHIND_MAX_ATTEMPTS=2,
+                       WRITE_BEHIND_FLUSH_SECONDS=0)
+    def test_failing_batch_is_quarantined(self):
+        """Пачку с плохой операцией повторяют, затем пишут по одной, а
+        плохую операцию откладывают в .failed."""
+        writebehind.submit(writebehind.COMMENT, self.reader.pk,
+                           post_id=self.post.pk, parent_id=None,
+                           text='Хороший')
+        # Без текста операция падает при записи.
+        bad = writebehind.submit(writebehind.COMMENT, self.reader.pk,
+                                 post_id=self.post.pk, parent_id=None)
+        with self.assertLogs('posts.writebehind', 'ERROR'):
+            self.assertEqual(writebehind.flush(), 0)
+            self.assertFalse(Comment.objects.exists())
+            self.assertEqual(len(writebehind.pending(self.reader.pk)), 2)
+            self.assertEqual(writebehind.flush(), 1)
+        self.assertTrue(Comment.objects.filter(text='Хороший').exists())
+        self.assertEqual(writebehind.pending(self.reader.pk), [])
+        [failed] = os.listdir(self.spool)
+        self.assertTrue(failed.endswith('.failed'))
+        with open(os.path.join(self.spool, failed)) as file:
+            self.assertEqual([json.loads(line)['id'] for line in file],
+                             [bad['id']])
+        self.assertEqual(writebehind.flush(), 0)
+
+    def test_worker_survives_failing_flush(self):
+        """Исключение при сбросе логируется, и поток продолжает работу."""
+        failures = [RuntimeError(), KeyboardInterrupt()]
+        with self.settings(WRITE_BEHIND_FLUSH_SECONDS=0), \
+                mock.patch.object(writebehind, 'flush',
+                                  side_effect=failures) as flush, \
+                self.assertLogs('posts.writebehind', 'ERROR'):
+            with self.assertRaises(KeyboardInterrupt):
+                writebehind._run()
+        self.assertEqual(flush.call_count, 2)
+
+
+class PostCardTagTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create(username='i.ivanov+blog@mail')
+        cls.group = Group.objects.create(
+            title='Тестовая группа', slug='test_slug', description='-')
+        for i in range(3):
+            Post.objects.create(author=cls.user, group=cls.group,
+                                text=f'Карточка {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_fast_reverse_matches_reverse(self):
+        """Ссылки из развёрнутых маршрутов совпадают с reverse()."""
+        for name, arg in (('posts:profile', self.user.username),
+                          ('posts:profile', 'имя пользователя'),
+                          ('posts:group_posts', self.group.slug),
+                          ('posts:post_detail', 42)):
+            with self.subTest(name=name, arg=arg):
+                self.assertEqual(fast_reverse(name, arg),
+                                 reverse(name, args=[arg]))
+
+    def test_cards_are_rendered_with_links(self):
+        """post_card выводит карточки со ссылками и разделителями."""
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, '<article>', count=3)
+        self.assertContains(response, '<hr>', count=2)
+        self.assertContains(
+            response, reverse('posts:profile', args=[self.user.username]),
+            count=3)
+        for post in Post.objects.all():
+            self.assertContains(
+                response, reverse('posts:post_detail', args=[post.pk]))
+
+    def test_hidden_links(self):
+        """В ленте группы нет ссылки на группу, в профиле — на автора."""
+        group_url = reverse('posts:group_posts', args=[self.group.slug])
+        profile_url = reverse('posts:profile', args=[self.user.username])
+        response = self.client.get(group_url)
+        self.assertNotContains(response, f'href="{group_url}"')
+        self.assertContains(response, f'href="{profile_url}"', count=3)
+        response = self.client.get(profile_url)
+        self.assertNotContains(response, 'все посты пользователя')
+        self.assertContains(response, f'href="{group_url}"', count=3)
+
+    def test_cards_are_cached_by_post_version(self):
+        """Лента берёт карточки из кеша и рендерит только изменённые."""
+        self.client.get(reverse('posts:index'))
+        kept, edited = Post.objects.all()[:2]
+        # Подменённая в кеше карточка докажет, что её не рендерили.
+        cache.set(caching.card_key(kept, False, False), 'Из кеша')
+        edited.text = 'Изменённый пост'
+        edited.save()
+        response = self.client.get(reverse('posts:index'))
+        self.assertContains(response, 'Из кеша', count=1)
+        self.assertContains(response, 'Изменённый пост')
+        self.assertNotContains(response, kept.text)
+
+
+class BenchmarkCommandTest(TestCase):
+    def test_benchmark_views_writes_comparable_report(self):
+        """benchmark_views пишет отчёт и сравнивает его с базовым."""
+        with tempfile.NamedTemporaryFile('r', suffix='.json') as report:
+            call_command('benchmark_views', scales=[40], repeat=2,
+                         in_place=True, output=report.name,
+                         stdout=StringIO())
+            data = json.load(report)
+            self.assertEqual(set(data['scales']['40']), {
+                'index', 'group_posts', 'profile', 'post_detail',
+                'follow_index', 'post_create', 'add_comment',
+            })
+            self.assertGreater(data['scales']['40']['index']['queries'], 0)
+            out = StringIO()
+            call_command('benchmark_views', scales=[40], repeat=2,
+                         in_place=True, views='index', threshold=100,
+                         compare=report.name, stdout=out)
+            self.assertIn('Регрессий нет', out.getvalue())
+        self.assertFalse(Post.objects.exists())
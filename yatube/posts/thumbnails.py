@@ -0,0 +1,198 @@
+# posts/thumbnails.py
+"""Фоновая подготовка картинок постов.
+
+Из загруженной картинки нарезаются варианты шириной WIDTHS с
+пропорциями карточки в WebP (и AVIF, если Pillow его умеет) и в
+исходном формате. Варианты лежат в каталоге поста
+(posts/cat.jpg поста 7 -> posts/variants/7/cat_jpg_640w.webp), а их
+srcset вместе с URL миниатюры для <img src> записываются в пост.
+Карточка поста выводит готовые строки и не трогает картинки в запросе;
+до тех пор шаблон выводит оригинал.
+
+Картинки считаются пулом потоков после фиксации транзакции, в которой
+сохранён пост, а для уже загруженных картинок — командой
+generate_thumbnails.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from . import caching
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 960, 1920)
+# Ширина миниатюры для <img src> у браузеров без srcset.
+FALLBACK_WIDTH = 960
+RATIO = 960 / 339
+
+SAVE_OPTIONS = {
+    'AVIF': {'quality': 60},
+    'WEBP': {'quality': 80, 'method': 6},
+    'JPEG': {'quality': 85, 'optimize': True, 'progressive': True},
+    'PNG': {'optimize': True},
+}
+EXTENSIONS = {'AVIF': 'avif', 'WEBP': 'webp', 'JPEG': 'jpg', 'PNG': 'png'}
+VARIANTS_DIR = 'posts/variants'
+
+_executor = None
+
+
+def executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.THUMBNAIL_WORKERS,
+            thread_name_prefix='thumbnails',
+        )
+    return _executor
+
+
+def modern_formats():
+    """Форматы для <source>, от самого компактного."""
+    Image.init()
+    return [fmt for fmt in ('AVIF', 'WEBP') if fmt in Image.SAVE]
+
+
+def fallback_format(image):
+    return 'JPEG' if image.format == 'JPEG' else 'PNG'
+
+
+def crop(image):
+    """Обрезает картинку по центру до пропорций карточки."""
+    width, height = image.size
+    if width / height > RATIO:
+        new_width = round(height * RATIO)
+        left = (width - new_width) // 2
+        return image.crop((left, 0, left + new_width, height))
+    new_height = round(width / RATIO)
+    top = (height - new_height) // 2
+    return image.crop((0, top, width, top + new_height))
+
+
+def variant_name(post_id, image_name, width, fmt):
+    """Имя варианта в каталоге поста.
+
+    Имя оригинала входит целиком, с расширением: варианты cat.jpg и
+    cat.png, в том числе у одного поста, не совпадают, а загрузки
+    пользователей в каталог вариантов не попадают.
+    """
+    stem = os.path.basename(image_name).replace('.', '_')
+    return (f'{VARIANTS_DIR}/{post_id}/{stem}_{width}w.'
+            f'{EXTENSIONS[fmt]}')
+
+
+def save_variant(image, name, fmt):
+    if fmt == 'JPEG':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    buffer = BytesIO()
+    image.save(buffer, fmt, **SAVE_OPTIONS[fmt])
+    # Иначе при пересчёте storage сохранил бы файл под новым именем.
+    # Удаляется только прежний вариант того же поста (см. variant_name).
+    default_storage.delete(name)
+    default_storage.save(name, ContentFile(buffer.getvalue()))
+    return default_storage.url(name)
+
+
+def render_variants(post_id, image_name):
+    """Нарезает варианты картинки и возвращает поля поста.
+
+    Только работа с файлами, без запросов к базе, поэтому функцию можно
+    вызывать из пула без соединения с базой.
+    """
+    with default_storage.open(image_name) as file:
+        source = Image.open(file)
+        fallback = fallback_format(source)
+        cropped = crop(ImageOps.exif_transpose(source))
+        cropped.load()
+    # Увеличивать картинку имеет смысл только до самой узкой ширины.
+    widths = [w for w in WIDTHS if w <= cropped.width] or [WIDTHS[0]]
+    variants = {}
+    thumbnail = ''
+    for width in widths:
+        height = round(width / RATIO)
+        resized = cropped.resize((width, height), Image.LANCZOS)
+        for fmt in modern_formats() + [fallback]:
+            name = variant_name(post_id, image_name, width, fmt)
+            url = save_variant(resized, name, fmt)
+            variants.setdefault(Image.MIME[fmt], []).append(f'{url} {width}w')
+            if fmt == fallback and width <= FALLBACK_WIDTH:
+                thumbnail = url
+    return {
+        'thumbnail': thumbnail,
+        'image_variants': json.dumps(
+            {mime: ', '.join(srcset) for mime, srcset in variants.items()}),
+    }
+
+
+def store(post_id, image_name, fields):
+    """Записывает варианты в пост, если его картинку не успели сменить."""
+    # update() не трогает auto_now, а карточка поста меняется.
+    updated = Post.objects.filter(pk=post_id, image=image_name).update(
+        updated_at=timezone.now(), **fields)
+    if updated:
+        post = Post.objects.only('author', 'group').get(pk=post_id)
+        caching.invalidate_post(post)
+    return bool(updated)
+
+
+def generate(post_id, image_name):
+    """Готовит варианты картинки одного поста."""
+    try:
+        store(post_id, image_name, render_variants(post_id, image_name))
+    except Exception:
+        logger.exception('Не удалось подготовить картинки поста %s',
+                         post_id)
+    finally:
+        if settings.THUMBNAIL_ASYNC:
+            # Соединение потока пула иначе осталось бы открытым.
+            connection.close()
+
+
+def generate_many(rows, workers=None):
+    """Готовит варианты для пар (id поста, картинка) пачкой.
+
+    Картинки режутся параллельно, а посты обновляются одной
+    транзакцией. Возвращает число обновлённых постов.
+    """
+    rows = list(rows)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(lambda row: _render_or_none(*row), rows))
+    with transaction.atomic():
+        return sum(
+            store(post_id, image_name, fields)
+            for (post_id, image_name), fields in zip(rows, results)
+            if fields is not None
+        )
+
+
+def _render_or_none(post_id, image_name):
+    try:
+        return render_variants(post_id, image_name)
+    except Exception:
+        logger.exception('Не удалось нарезать картинку %s', image_name)
+        return None
+
+
+def schedule(post):
+    """Ставит в очередь картинки для сохранённого поста."""
+    if not post.image:
+        return
+    post_id, image_name = post.pk, post.image.name
+    if settings.THUMBNAIL_ASYNC:
+        transaction.on_commit(
+            lambda: executor().submit(generate, post_id, image_name))
+    else:
+        transaction.on_commit(lambda: generate(post_id, image_name))
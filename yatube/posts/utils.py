@@ -1,9 +1,237 @@
-from django.core.paginator import Paginator
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import defaultdict
+from collections.abc import Sequence
+
 from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+
+from .models import Comment
+
+PAGE_PARAM = 'page'
+CURSOR_PARAM = 'cursor'
+
+AFTER = 'a'
+BEFORE = 'b'
+
+
+class CursorPage(Sequence):
+    """Страница ленты при курсорной пагинации.
+
+    Повторяет ту часть интерфейса Page, которой пользуются шаблоны,
+    но ничего не знает об общем количестве записей и страниц.
+    """
+    is_cursor = True
+
+    def __init__(self, object_list, paginator,
+                 next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage {self.previous_cursor}:{self.next_cursor}>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """Пагинатор по ключу сортировки (по умолчанию pub_date, id).
+
+    Следующая и предыдущая страницы выбираются условием WHERE по
+    значениям ключа крайней записи, поэтому не нужны ни COUNT(*),
+    ни OFFSET, и глубина страницы не влияет на время запроса.
+    """
+
+    def __init__(self, object_list, per_page,
+                 ordering=('-pub_date', '-id')):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
 
+    def _position(self, obj):
+        if isinstance(obj, dict):
+            return [obj[field] for field in self.fields]
+        return [getattr(obj, field) for field in self.fields]
 
-def get_page_obj(posts, request):
+    def encode_cursor(self, obj, direction):
+        values = [
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in self._position(obj)
+        ]
+        raw = json.dumps([direction, values], separators=(',', ':'))
+        return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """Возвращает (направление, значения ключа) или None."""
+        if not cursor:
+            return None
+        try:
+            padding = '=' * (-len(cursor) % 4)
+            direction, values = json.loads(
+                urlsafe_b64decode(cursor + padding).decode())
+            if direction not in (AFTER, BEFORE):
+                return None
+            if len(values) != len(self.fields):
+                return None
+            opts = self.object_list.model._meta
+            values = [
+                opts.get_field(field).to_python(value)
+                for field, value in zip(self.fields, values)
+            ]
+        except (ValueError, TypeError, ValidationError):
+            return None
+        return direction, values
+
+    def _seek(self, values, reverse):
+        """Условие "строго после ключа" в порядке self.ordering.
+
+        При reverse=True условие строится для обратного порядка.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{name}__{lookup}': values[index]})
+            for prev_name, prev_value in zip(self.fields[:index],
+                                             values[:index]):
+                step &= Q(**{prev_name: prev_value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [
+            field[1:] if field.startswith('-') else f'-{field}'
+            for field in self.ordering
+        ]
+
+    def _fetch(self, queryset, ordering):
+        """Запись страницы и признак того, что за ней есть ещё."""
+        rows = list(queryset.order_by(*ordering)[:self.per_page + 1])
+        return rows[:self.per_page], len(rows) > self.per_page
+
+    def get_page(self, cursor=None):
+        position = self.decode_cursor(cursor)
+        queryset = self.object_list
+        if position is None:
+            rows, has_more = self._fetch(queryset, self.ordering)
+            return self._page(rows, has_next=has_more, has_previous=False)
+        direction, values = position
+        if direction == AFTER:
+            rows, has_more = self._fetch(
+                queryset.filter(self._seek(values, reverse=False)),
+                self.ordering,
+            )
+            return self._page(rows, has_next=has_more, has_previous=True)
+        rows, has_more = self._fetch(
+            queryset.filter(self._seek(values, reverse=True)),
+            self._reversed_ordering(),
+        )
+        return self._page(rows[::-1], has_next=True, has_previous=has_more)
+
+    def _page(self, rows, has_next, has_previous):
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(rows[-1], AFTER)
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(rows[0], BEFORE)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+def get_page_obj(posts, request, cursor=None):
+    """Страница ленты; cursor=None — режим из POSTS_CURSOR_PAGINATION."""
+    if cursor is None:
+        cursor = settings.POSTS_CURSOR_PAGINATION
+    if cursor:
+        paginator = CursorPaginator(posts, settings.POSTS_Q)
+        return paginator.get_page(request.GET.get(CURSOR_PARAM))
     paginator = Paginator(posts, settings.POSTS_Q)
-    page_number = request.GET.get('page')
+    page_number = request.GET.get(PAGE_PARAM)
     page_obj = paginator.get_page(page_number)
     return page_obj
+
+
+def comments_for_window():
+    return Comment.objects.select_related('author').only(
+        'text', 'created', 'post_id', 'parent_id', 'thread', 'path',
+        'author__username')
+
+
+def get_comments_page(post_id, request):
+    """Окно из COMMENTS_PER_PAGE веток комментариев поста.
+
+    Корни веток идут от новых к старым, следующие окна выбираются по
+    курсору (created, id). Из каждой ветки окна читаются первые
+    COMMENT_REPLIES_PER_THREAD ответов: вторым запросом по индексу
+    (thread, path), в порядке обхода, под своими корнями. Последний
+    показанный ответ ветки, в которой остались другие, получает
+    more_replies — шаблон ставит под ним ссылку на get_replies_page.
+    """
+    limit = settings.COMMENT_REPLIES_PER_THREAD
+    comments = comments_for_window()
+    paginator = CursorPaginator(
+        comments.filter(post_id=post_id).roots().with_replies_cutoff(limit),
+        settings.COMMENTS_PER_PAGE,
+        ordering=('-created', '-id'),
+    )
+    page = paginator.get_page(request.GET.get(CURSOR_PARAM))
+    replies = defaultdict(list)
+    for reply in comments.replies_before_cutoff(page.object_list):
+        replies[reply.thread].append(reply)
+    object_list = []
+    for root in page.object_list:
+        thread = [root, *replies[root.pk]]
+        thread[-1].more_replies = root.replies_cutoff is not None
+        object_list += thread
+    page.object_list = object_list
+    return page
+
+
+def get_replies_page(post_id, comment_id, after):
+    """Следующие COMMENT_REPLIES_PER_THREAD ответов ветки после пути after.
+
+    comment_id — корень ветки. Ответы читаются из subtree корня по
+    индексу path, так что ветка любой длины отдаётся окнами.
+    """
+    limit = settings.COMMENT_REPLIES_PER_THREAD
+    root = get_object_or_404(
+        Comment.objects.only('path').roots(), pk=comment_id, post_id=post_id)
+    replies = list(comments_for_window().subtree(root).filter(
+        path__gt=max(after, root.path))[:limit + 1])
+    more = len(replies) > limit
+    replies = replies[:limit]
+    if replies:
+        replies[-1].more_replies = more
+    return replies
+
+
+def get_reply_parent(post_id, parent_id):
+    """Комментарий поста, на который отвечают, или None для новой ветки."""
+    if not parent_id:
+        return None
+    if not str(parent_id).isdigit():
+        raise Http404
+    return get_object_or_404(
+        Comment.objects.only('post_id', 'thread', 'path'),
+        pk=parent_id, post_id=post_id,
+    )
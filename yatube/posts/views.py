@@ -1,14 +1,28 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.utils.http import urlencode
 
+from . import thumbnails, writebehind
+from .conditional import (conditional_page, group_scopes, index_scopes,
+                          post_scopes, profile_scopes, replies_scopes)
+from .feeds import timeline_posts
 from .forms import CommentForm, PostForm
-from .models import Comment, Follow, Group, Post, User
-from .utils import get_page_obj
+from .models import Follow, Group, Post, User
+from .search import ranked
+from .utils import (get_comments_page, get_page_obj, get_replies_page,
+                    get_reply_parent)
 
+EDIT_CONFLICT = ('Пост изменили, пока вы его редактировали. Проверьте '
+                 'текст и сохраните ещё раз.')
 
+
+@conditional_page(index_scopes)
 def index(request):
-    posts = Post.objects.all()
+    posts = Post.objects.for_feed()
     page_obj = get_page_obj(posts, request)
     context = {'page_obj': page_obj}
     return render(request,
@@ -16,22 +30,44 @@ def index(request):
                   context)
 
 
+def search(request):
+    query = request.GET.get('q', '').strip()
+    posts = Post.objects.none()
+    if query:
+        posts = ranked(Post.objects.for_feed(), query)
+    # Выдача отсортирована по релевантности, курсор по дате тут не годится.
+    page_obj = get_page_obj(posts, request, cursor=False)
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+        'page_query': urlencode({'q': query}) + '&' if query else '',
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@conditional_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
-    posts = group.posts.all()
+    posts = group.posts.for_feed()
     page_obj = get_page_obj(posts, request)
     return render(request,
                   'posts/group_list.html',
                   {**{'group': group, 'page_obj': page_obj}})
 
 
+@conditional_page(profile_scopes)
 def profile(request, username):
-    author = User.objects.get(username=username)
-    posts = author.posts.all()
+    author = get_object_or_404(
+        User.objects.select_related('stats'), username=username)
+    posts = author.posts.for_feed()
     page_obj = get_page_obj(posts, request)
-    following = False
-    if Follow.objects.filter(user=request.user.id, author=author):
-        following = True
+    following = writebehind.pending_following(request.user.pk, author.pk)
+    if following is None:
+        following = (
+            request.user.is_authenticated
+            and Follow.objects.filter(user=request.user,
+                                      author=author).exists()
+        )
     context = {
         'author': author,
         'page_obj': page_obj,
@@ -42,18 +78,45 @@ def profile(request, username):
                   context)
 
 
+@conditional_page(post_scopes)
 def post_detail(request, post_id):
     form = CommentForm(request.POST or None)
-    post_list = get_object_or_404(Post, pk=post_id)
-    comments = Comment.objects.filter(post=post_list)
+    post_list = get_object_or_404(Post.objects.for_detail(), pk=post_id)
     context = {
         'post': post_list,
         'form': form,
-        'comments': comments,
+        'comments': get_comments_page(post_id, request),
+        'pending_comments': writebehind.pending_comments(
+            request.user.pk, post_list.pk),
+        'reply_to': request.GET.get('reply', ''),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@conditional_page(post_scopes)
+def post_comments(request, post_id):
+    """Следующее окно комментариев поста HTML-фрагментом."""
+    comments = get_comments_page(post_id, request)
+    if not comments and not Post.objects.filter(pk=post_id).exists():
+        raise Http404
+    context = {
+        'post_id': post_id,
+        'comments': comments,
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
+@conditional_page(replies_scopes)
+def comment_replies(request, post_id, comment_id):
+    """Следующие ответы ветки комментариев HTML-фрагментом."""
+    context = {
+        'post_id': post_id,
+        'comments': get_replies_page(post_id, comment_id,
+                                     request.GET.get('after', '')),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     template_name = 'posts/post_create.html'
@@ -62,6 +125,7 @@ def post_create(request):
         new_post = form.save(commit=False)
         new_post.author = request.user
         new_post.save()
+        thumbnails.schedule(new_post)
         return redirect('posts:profile', new_post.author.username)
     return render(request, template_name, {'form': form})
 
@@ -76,26 +140,53 @@ def post_edit(request, post_id):
         files=request.FILES or None,
         instance=post
     )
+    # Версия поста, которую видел автор, открывая форму; без неё
+    # (старая форма) правка сохраняется как раньше.
+    version = request.POST.get('version')
+    status = 200
     if form.is_valid():
-        form.save()
-        return redirect('posts:post_detail', post_id)
+        with transaction.atomic():
+            saved = version is None or post.claim_version(version)
+            if saved:
+                post = form.save(commit=False)
+                if version is None:
+                    post.edit_version += 1
+                if 'image' in form.changed_data:
+                    post.thumbnail = post.image_variants = ''
+                post.save()
+        if saved:
+            if 'image' in form.changed_data:
+                thumbnails.schedule(post)
+            return redirect('posts:post_detail', post_id)
+        form.add_error(None, EDIT_CONFLICT)
+        status = 409
+        post = Post.objects.only('edit_version').get(pk=post_id)
     context = {
         'form': form,
         'is_edit': True,
         'post_id': post_id,
+        'version': post.version,
     }
-    return render(request, 'posts/post_create.html', context)
+    return render(request, 'posts/post_create.html', context, status=status)
 
 
 @login_required
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(Post.objects.only('pk'), pk=post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
-        comment = form.save(commit=False)
-        comment.author = request.user
-        comment.post = post
-        comment.save()
+        parent = get_reply_parent(post_id, request.POST.get('parent'))
+        if settings.WRITE_BEHIND:
+            writebehind.submit(
+                writebehind.COMMENT, request.user.pk, post_id=post.pk,
+                parent_id=parent and parent.pk,
+                text=form.cleaned_data['text'])
+        else:
+            comment = form.save(commit=False)
+            comment.author = request.user
+            comment.post = post
+            comment.parent = parent
+            comment.save()
         return redirect('posts:post_detail', post_id=post_id)
     context = {
         'post': post,
@@ -107,7 +198,7 @@ def add_comment(request, post_id):
 
 @login_required
 def follow_index(request):
-    post_list = Post.objects.filter(author__following__user=request.user)
+    post_list = timeline_posts(request.user).for_feed()
     page_obj = get_page_obj(post_list, request)
     context = {'page_obj': page_obj}
     return render(request,
@@ -117,18 +208,26 @@ def follow_index(request):
 
 @login_required
 def profile_follow(request, username):
-    user = request.user
-    author = get_object_or_404(User, username=username)
-    is_follower = Follow.objects.filter(user=user, author=author)
-    if user != author and not is_follower.exists():
-        Follow.objects.create(user=user, author=author)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    if request.user != author and settings.WRITE_BEHIND:
+        writebehind.submit(writebehind.FOLLOW, request.user.pk,
+                           author_id=author.pk)
+    elif request.user != author:
+        try:
+            with transaction.atomic():
+                Follow.objects.create(user=request.user, author=author)
+        except IntegrityError:
+            # Подписка уже есть: её держит ограничение unique_follow.
+            pass
     return redirect(reverse('posts:profile', args=[username]))
 
 
 @login_required
 def profile_unfollow(request, username):
-    author = get_object_or_404(User, username=username)
-    is_follower = Follow.objects.filter(user=request.user, author=author)
-    if is_follower.exists():
-        is_follower.delete()
-    return redirect('posts:profile', username=author)
+    author = get_object_or_404(User.objects.only('pk'), username=username)
+    if settings.WRITE_BEHIND:
+        writebehind.submit(writebehind.UNFOLLOW, request.user.pk,
+                           author_id=author.pk)
+    else:
+        Follow.objects.filter(user=request.user, author=author).delete()
+    return redirect('posts:profile', username=username)
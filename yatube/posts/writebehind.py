@@ -0,0 +1,457 @@
+# posts/writebehind.py
+"""Отложенная пакетная запись комментариев и подписок.
+
+При WRITE_BEHIND вью не пишут в базу сами: операция дописывается в
+спул процесса (WRITE_BEHIND_SPOOL_DIR/<процесс>.jsonl, с fsync) и в
+очередь в памяти. Фоновый поток раз в WRITE_BEHIND_FLUSH_SECONDS
+забирает очередь и применяет её одной транзакцией: комментарии и
+подписки — bulk_create, счётчики — одним UPDATE на пост и
+пользователя. Так пачка записей берёт блокировку записи SQLite один
+раз, а не на каждый запрос.
+
+Пока операция не записана, она лежит в кеше в списке ожидающих
+операций пользователя: страницы поста и профиля показывают её автору
+сразу (read-your-writes), а ETag страниц учитывает этот список.
+
+<процесс> — pid и случайная метка: после перезапуска, например в
+контейнере, pid часто повторяется, и без метки новый процесс принял бы
+спул прежнего за свой. Перед применением спул переименовывается в
+<процесс>-<время>.batch и удаляется после фиксации транзакции. Файлы,
+оставшиеся от упавших процессов, подбирает следующий сброс любого
+процесса или команда flush_write_behind; комментарии из них сверяются
+с базой по id операции (Comment.writebehind_id), чтобы не задвоиться,
+если процесс упал между фиксацией и удалением файла.
+
+Пачка, которую не удалось записать, остаётся файлом и повторяется при
+следующих сбросах с удваивающейся паузой; число попыток хранится в
+имени файла. После WRITE_BEHIND_MAX_ATTEMPTS попыток операции пачки
+пишутся по одной, а те, что так и не записались, откладываются в
+<процесс>-<время>-<попытки>.failed и убираются из ожидающих: одна плохая
+операция не держит остальные.
+"""
+import atexit
+import glob
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Case, DateTimeField, Q, Value, When
+
+from . import caching, counters, feeds
+from .models import Comment, Follow, Post
+
+logger = logging.getLogger(__name__)
+
+COMMENT = 'comment'
+FOLLOW = 'follow'
+UNFOLLOW = 'unfollow'
+# Три параметра запроса на операцию: до лимита SQLite в 999.
+SUBMITTED_CHUNK = 300
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_queue = []
+_spool = None
+_wakeup = threading.Event()
+_worker = None
+_atexit_registered = False
+_owner = None
+
+
+def pending_key(user_id):
+    return f'writebehind:pending:{user_id}'
+
+
+def pending(user_id):
+    """Ещё не записанные операции пользователя."""
+    if not settings.WRITE_BEHIND or user_id is None:
+        return []
+    return cache.get(pending_key(user_id), [])
+
+
+def pending_token(user_id):
+    """Отпечаток ожидающих операций для ETag страниц."""
+    ops = pending(user_id)
+    if not ops:
+        return ''
+    return hashlib.md5(
+        ':'.join(op['id'] for op in ops).encode()).hexdigest()
+
+
+def pending_comments(user_id, post_id):
+    return [op for op in pending(user_id)
+            if op['kind'] == COMMENT and op['post_id'] == post_id]
+
+
+def pending_following(user_id, author_id):
+    """True/False, если подписка или отписка ещё в очереди, иначе None."""
+    state = None
+    for op in pending(user_id):
+        if op['kind'] in (FOLLOW, UNFOLLOW) and op['author_id'] == author_id:
+            state = op['kind'] == FOLLOW
+    return state
+
+
+def _remember(op, user_id):
+    # Чтение и запись списка не атомарны, поэтому у списка есть TTL:
+    # потерянная или застрявшая запись живёт не дольше него.
+    key = pending_key(user_id)
+    cache.set(key, [*cache.get(key, []), op],
+              settings.WRITE_BEHIND_PENDING_TIMEOUT)
+
+
+def _forget(ops):
+    done = defaultdict(set)
+    for op in ops:
+        done[op['user_id']].add(op['id'])
+    for user_id, ids in done.items():
+        key = pending_key(user_id)
+        left = [op for op in cache.get(key, []) if op['id'] not in ids]
+        if left:
+            cache.set(key, left, settings.WRITE_BEHIND_PENDING_TIMEOUT)
+        else:
+            cache.delete(key)
+
+
+def owner():
+    """Метка процесса в именах файлов: <pid>_<случайная метка>."""
+    global _owner
+    pid = os.getpid()
+    # Метка выбирается заново и в дочернем процессе после fork.
+    if _owner is None or _owner[0] != pid:
+        _owner = (pid, uuid.uuid4().hex[:8])
+    return f'{pid}_{_owner[1]}'
+
+
+def spool_path():
+    return os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, f'{owner()}.jsonl')
+
+
+def batch_path(attempts=0, ext='.batch'):
+    """Новый файл пачки этого процесса: <процесс>-<время>-<попытки>."""
+    return os.path.join(settings.WRITE_BEHIND_SPOOL_DIR,
+                        f'{owner()}-{time.time_ns()}-{attempts}{ext}')
+
+
+def attempts(path):
+    """Сколько раз пачку уже не удалось записать."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        return int(name.split('-')[2])
+    except (IndexError, ValueError):
+        return 0
+
+
+def _retry_due(path):
+    """Пора ли повторить свою неудачную пачку.
+
+    Пауза удваивается с каждой попыткой, так что короткий сбой базы не
+    исчерпывает попытки за несколько сбросов.
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    try:
+        created = int(name.split('-')[1])
+    except (IndexError, ValueError):
+        return True
+    delay = settings.WRITE_BEHIND_FLUSH_SECONDS * 2 ** attempts(path)
+    return time.time_ns() - created >= delay * 1e9
+
+
+def submit(kind, user_id, **fields):
+    """Ставит операцию в очередь; вернёт её сразу, до записи в базу."""
+    global _spool
+    op = {'id': uuid.uuid4().hex, 'kind': kind, 'user_id': user_id,
+          'submitted': time.time(), **fields}
+    line = json.dumps(op, ensure_ascii=False) + '\n'
+    with _lock:
+        if _spool is None:
+            os.makedirs(settings.WRITE_BEHIND_SPOOL_DIR, exist_ok=True)
+            _spool = open(spool_path(), 'a', encoding='utf-8')
+        _spool.write(line)
+        _spool.flush()
+        os.fsync(_spool.fileno())
+        _queue.append(op)
+        size = len(_queue)
+    _remember(op, user_id)
+    if settings.WRITE_BEHIND_ASYNC:
+        start_worker()
+        if size >= settings.WRITE_BEHIND_BATCH_SIZE:
+            _wakeup.set()
+    return op
+
+
+def _rotate():
+    """Забирает очередь и переименовывает спул в файл пачки."""
+    global _spool
+    with _lock:
+        ops = _queue[:]
+        _queue.clear()
+        if _spool is None:
+            return ops, None
+        _spool.close()
+        _spool = None
+        batch = batch_path()
+        os.replace(spool_path(), batch)
+    return ops, batch
+
+
+def _pid_alive(pid):
+    if pid == os.getpid():
+        # Файл с нашим pid, но чужой меткой остался от прежнего
+        # процесса с тем же pid.
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def orphaned_files():
+    """Спулы и пачки упавших процессов и прошлые неудачные пачки этого."""
+    files = []
+    pattern = os.path.join(settings.WRITE_BEHIND_SPOOL_DIR, '*')
+    for path in sorted(glob.glob(pattern)):
+        name, ext = os.path.splitext(os.path.basename(path))
+        if ext not in ('.jsonl', '.batch'):
+            continue
+        file_owner = name.split('-')[0]
+        if file_owner == owner():
+            if ext == '.batch' and _retry_due(path):
+                files.append(path)
+            continue
+        try:
+            pid = int(file_owner.split('_')[0])
+        except ValueError:
+            continue
+        if not _pid_alive(pid):
+            files.append(path)
+    return files
+
+
+def _read(path):
+    ops = []
+    with open(path, encoding='utf-8') as file:
+        for line in file:
+            try:
+                ops.append(json.loads(line))
+            except ValueError:
+                # Недописанная последняя строка упавшего процесса.
+                continue
+    return ops
+
+
+def flush():
+    """Применяет очередь процесса и подобранные спулы.
+
+    Возвращает число применённых операций.
+    """
+    with _flush_lock:
+        applied = 0
+        for path in orphaned_files():
+            # Своя неудачная пачка уже в списке; чужой файл сначала
+            # забираем себе, чтобы его не применили два процесса.
+            claimed = batch_path(attempts(path))
+            try:
+                os.replace(path, claimed)
+            except FileNotFoundError:
+                continue
+            applied += _apply_file(_read(claimed), claimed, replay=True)
+        ops, batch = _rotate()
+        if batch is not None:
+            # Применяется то, что лежит в файле: он и есть журнал.
+            ops = _read(batch)
+        if ops:
+            applied += _apply_file(ops, batch, replay=False)
+        elif batch is not None:
+            os.remove(batch)
+        return applied
+
+
+def _apply_file(ops, path, replay):
+    try:
+        apply(ops, replay=replay)
+    except Exception:
+        failed = attempts(path) + 1 if path is not None else None
+        logger.exception('Не удалось записать пачку %s (попытка %s)',
+                         path, failed)
+        if failed is None or failed < settings.WRITE_BEHIND_MAX_ATTEMPTS:
+            if path is not None:
+                os.replace(path, batch_path(failed))
+            return 0
+        return _quarantine(ops, path)
+    if path is not None:
+        os.remove(path)
+    _forget(ops)
+    return len(ops)
+
+
+def _quarantine(ops, path):
+    """Пишет операции пачки по одной и откладывает те, что не вышли."""
+    failed = []
+    for op in ops:
+        try:
+            # replay: часть операций могла записаться на прошлом круге.
+            apply([op], replay=True)
+        except Exception:
+            failed.append(op)
+    if failed:
+        quarantined = batch_path(attempts(path), ext='.failed')
+        with open(quarantined, 'w', encoding='utf-8') as file:
+            for op in failed:
+                file.write(json.dumps(op, ensure_ascii=False) + '\n')
+        logger.error('Операций не удалось записать: %d, отложены в %s',
+                     len(failed), quarantined)
+    os.remove(path)
+    _forget(ops)
+    return len(ops) - len(failed)
+
+
+def apply(ops, replay=False):
+    """Записывает операции одной транзакцией.
+
+    replay=True — операции из спула упавшего процесса: часть из них
+    могла быть уже записана.
+    """
+    comments = [op for op in ops if op['kind'] == COMMENT]
+    # Для каждой пары (читатель, автор) важна последняя операция.
+    follows = {}
+    for op in ops:
+        if op['kind'] in (FOLLOW, UNFOLLOW):
+            follows[(op['user_id'], op['author_id'])] = op['kind']
+    with transaction.atomic():
+        if comments:
+            _write_comments(comments, replay)
+        if follows:
+            _write_follows(follows)
+
+
+def _write_comments(ops, replay):
+    post_ids = set(Post.objects.filter(
+        pk__in={op['post_id'] for op in ops}).values_list('pk', flat=True))
+    ops = [op for op in ops if op['post_id'] in post_ids]
+    if replay and ops:
+        written = set(Comment.objects.filter(
+            writebehind_id__in=[op['id'] for op in ops],
+        ).values_list('writebehind_id', flat=True))
+        ops = [op for op in ops if op['id'] not in written]
+    roots = [op for op in ops if not op.get('parent_id')]
+    Comment.objects.bulk_create(
+        Comment(post_id=op['post_id'], author_id=op['user_id'],
+                text=op['text'], writebehind_id=op['id'])
+        for op in roots
+    )
+    Comment.objects.place_roots()
+    # Путь ответа строится из id, которого bulk_create на SQLite не
+    # возвращает, поэтому ответы сохраняются по одному (с сигналами).
+    for op in ops:
+        if op.get('parent_id'):
+            parent = Comment.objects.filter(
+                pk=op['parent_id'], post_id=op['post_id']).first()
+            Comment.objects.create(
+                post_id=op['post_id'], author_id=op['user_id'],
+                text=op['text'], parent=parent, writebehind_id=op['id'])
+    _keep_submitted(ops)
+    for post_id, count in Counter(op['post_id'] for op in roots).items():
+        counters.bump_post_comments(post_id, count)
+        caching.invalidate_comments(post_id)
+    for user_id, count in Counter(op['user_id'] for op in roots).items():
+        counters.bump_user(user_id, 'comments_count', count)
+
+
+def _keep_submitted(ops):
+    """Ставит комментариям время отправки, а не время сброса.
+
+    created — auto_now_add, и при вставке Django всегда пишет в него
+    текущее время, поэтому оно исправляется отдельным UPDATE (по
+    SUBMITTED_CHUNK операций: SQLite ограничивает число параметров).
+    """
+    ops = [op for op in ops if op.get('submitted') is not None]
+    for start in range(0, len(ops), SUBMITTED_CHUNK):
+        chunk = ops[start:start + SUBMITTED_CHUNK]
+        Comment.objects.filter(
+            writebehind_id__in=[op['id'] for op in chunk],
+        ).update(created=Case(*(
+            When(writebehind_id=op['id'], then=Value(
+                datetime.fromtimestamp(op['submitted'], timezone.utc)))
+            for op in chunk
+        ), output_field=DateTimeField()))
+
+
+def _write_follows(follows):
+    wanted = [pair for pair, kind in follows.items()
+              if kind == FOLLOW and pair[0] != pair[1]]
+    unwanted = [pair for pair, kind in follows.items() if kind == UNFOLLOW]
+    if unwanted:
+        condition = Q()
+        for user_id, author_id in unwanted:
+            condition |= Q(user_id=user_id, author_id=author_id)
+        # Отписки редки; сигналы post_delete сами поправят счётчики и
+        # ленты.
+        Follow.objects.filter(condition).delete()
+    if not wanted:
+        return
+    condition = Q()
+    for user_id, author_id in wanted:
+        condition |= Q(user_id=user_id, author_id=author_id)
+    existing = set(Follow.objects.filter(condition).values_list(
+        'user_id', 'author_id'))
+    new = [pair for pair in wanted if pair not in existing]
+    Follow.objects.bulk_create(
+        (Follow(user_id=user_id, author_id=author_id)
+         for user_id, author_id in new),
+        ignore_conflicts=True,
+    )
+    # Часть пар могли вставить параллельно, и ignore_conflicts их молча
+    # пропустил: счётчики пересчитываются по тому, что теперь в базе.
+    counters.recount('following_count', {user for user, _ in new})
+    counters.recount('followers_count', {author for _, author in new})
+    for author_id in {author for _, author in new}:
+        caching.invalidate_profile(author_id)
+    for user_id, author_id in new:
+        feeds.backfill_timeline(user_id, author_id)
+
+
+def _run():
+    global _worker
+    try:
+        while True:
+            _wakeup.wait(settings.WRITE_BEHIND_FLUSH_SECONDS)
+            _wakeup.clear()
+            try:
+                flush()
+            except Exception:
+                # Ошибка одного сброса не должна останавливать поток:
+                # операции остаются в файлах и повторятся следующим сбросом.
+                logger.exception('Сброс отложенных операций не удался')
+            finally:
+                connections.close_all()
+    finally:
+        # Если поток всё же завершился, следующий submit запустит новый.
+        with _lock:
+            if _worker is threading.current_thread():
+                _worker = None
+
+
+def start_worker():
+    global _worker, _atexit_registered
+    if _worker is None or not _worker.is_alive():
+        with _lock:
+            if _worker is None or not _worker.is_alive():
+                _worker = threading.Thread(
+                    target=_run, name='write-behind', daemon=True)
+                _worker.start()
+                if not _atexit_registered:
+                    atexit.register(flush)
+                    _atexit_registered = True
@@ -0,0 +1,25 @@
+"""Настройки проекта по окружениям.
+
+Окружение задаёт переменная YATUBE_ENV:
+
+* prod (по умолчанию) — без отладочных приложений: их модули не
+  импортируются вовсе;
+* dev (по умолчанию для manage.py) — DEBUG и django-debug-toolbar.
+
+Без переменной выбирается prod: точка входа, которая её не задала
+(свой WSGI- или ASGI-файл хостинга, путь приложения gunicorn), не
+должна работать с DEBUG.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+YATUBE_ENV = os.getenv('YATUBE_ENV', 'prod')
+
+if YATUBE_ENV == 'dev':
+    from .dev import *  # noqa: F401,F403
+elif YATUBE_ENV == 'prod':
+    from .prod import *  # noqa: F401,F403
+else:
+    raise ImproperlyConfigured(
+        f'Неизвестное окружение YATUBE_ENV={YATUBE_ENV!r}: dev или prod.')
@@ -0,0 +1,287 @@
+"""
+Django settings for yatube project.
+
+Общие настройки всех окружений; dev.py и prod.py дополняют их.
+
+Generated by 'django-admin startproject' using Django 2.2.19.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/2.2/topics/settings/
+
+For the full list of settings and their values, see
+https://docs.djangoproject.com/en/2.2/ref/settings/
+"""
+
+import os
+
+# Build paths inside the project like this: os.path.join(BASE_DIR, ...)
+BASE_DIR = os.path.dirname(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+)
+
+
+# Quick-start development settings - unsuitable for production
+# See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
+
+# SECURITY WARNING: keep the secret key used in production secret!
+SECRET_KEY = 'kg9s+=z$b3ut!yo*vdp799n14$)62atji@3d%gf!%sw#d-18-2'
+
+# SECURITY WARNING: don't run with debug turned on in production!
+DEBUG = False
+
+# view-функция, обрабатывающая ошибку 403.
+CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
+
+ALLOWED_HOSTS = [
+    'localhost',
+    '127.0.0.1',
+    '[::1]',
+    'testserver',
+    'www.guess4w.pythonanywhere.com',
+    'guess4w.pythonanywhere.com',
+]
+
+# Application definition
+
+INSTALLED_APPS = [
+    'posts.apps.PostsConfig',
+    'django.contrib.admin',
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+    'django.contrib.sessions',
+    'django.contrib.messages',
+    'django.contrib.staticfiles',
+    'users.apps.UsersConfig',
+    'core.apps.CoreConfig',
+    'about.apps.AboutConfig',
+    'api.apps.ApiConfig',
+    'sorl.thumbnail',
+]
+
+MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
+    'core.queries.QueryLogMiddleware',
+    'django.middleware.security.SecurityMiddleware',
+    'django.contrib.sessions.middleware.SessionMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'django.middleware.csrf.CsrfViewMiddleware',
+    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'django.contrib.messages.middleware.MessageMiddleware',
+    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+]
+
+ROOT_URLCONF = 'yatube.urls'
+LOGIN_REDIRECT_URL = 'posts:index'
+LOGIN_URL = 'users:login'
+
+# LOGOUT_REDIRECT_URL = 'posts:index'
+
+EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
+
+POSTS_Q: int = 10
+# Сколько комментариев показывает страница поста и каждая подгрузка.
+COMMENTS_PER_PAGE: int = 20
+# Сколько ответов ветки показывается сразу и в каждой подгрузке ветки.
+COMMENT_REPLIES_PER_THREAD: int = 10
+# Курсорная пагинация лент: без COUNT(*) и OFFSET, но без номеров страниц.
+POSTS_CURSOR_PAGINATION: bool = False
+# Посты авторов с большим числом подписчиков не раскладываются по лентам,
+# а подмешиваются при чтении. None — раскладывать всегда.
+FEED_FANOUT_MAX_FOLLOWERS: int = 5000
+# Сколько постов автора попадает в ленту при подписке и пересборке.
+FEED_TIMELINE_SIZE: int = 1000
+# Фрагменты лент сбрасываются сигналами, TTL лишь ограничивает память.
+FEED_CACHE_TIMEOUT: int = 60 * 60 * 6
+# TTL фрагментов, если кеш не общий (CACHE_SHARED): сброс в одном
+# процессе не доходит до других, и устаревший фрагмент живёт столько.
+FEED_CACHE_LOCAL_TIMEOUT: int = 30
+# Карточки постов версионируются ключом (posts.caching.card_key) и не
+# сбрасываются; TTL лишь ограничивает память.
+POST_CARD_CACHE_TIMEOUT: int = 60 * 60 * 24
+# Доля запросов, которые замеряет core.instrumentation, размер буфера
+# замеров процесса и заголовок Server-Timing у замеренных ответов.
+INSTRUMENTATION_SAMPLE_RATE: float = 0.05
+INSTRUMENTATION_BUFFER_SIZE: int = 2000
+INSTRUMENTATION_SERVER_TIMING: bool = True
+# Сводка SQL по вью и отпечаткам запросов (core.queries): запросы
+# дольше QUERY_LOG_SLOW_MS пишутся в лог core.queries, сводка процесса
+# раз в QUERY_LOG_FLUSH_SECONDS сохраняется в QUERY_LOG_DIR для команды
+# query_report. QUERY_LOG_SAMPLES — сколько последних длительностей
+# отпечатка хранится для перцентилей.
+QUERY_LOG_ENABLED: bool = True
+QUERY_LOG_SLOW_MS: float = 100
+QUERY_LOG_FLUSH_SECONDS: int = 60
+QUERY_LOG_SAMPLES: int = 500
+QUERY_LOG_DIR = os.path.join(BASE_DIR, 'querylog')
+# Входит в ETag страниц лент и поста: увеличьте, если после выкладки
+# изменились шаблоны, чтобы браузеры не получили 304 на старую вёрстку.
+PAGES_ETAG_VERSION: str = '1'
+# Миниатюры картинок постов считаются в фоне пулом из стольких потоков.
+THUMBNAIL_ASYNC: bool = True
+THUMBNAIL_WORKERS: int = 2
+# Отложенная запись комментариев и подписок (posts.writebehind): пачки
+# раз в WRITE_BEHIND_FLUSH_SECONDS или по WRITE_BEHIND_BATCH_SIZE
+# операций; до записи операции лежат в спуле на диске и в кеше
+# (для read-your-writes нужен общий кеш, см. YATUBE_CACHE_BACKEND).
+WRITE_BEHIND: bool = False
+WRITE_BEHIND_ASYNC: bool = True
+WRITE_BEHIND_FLUSH_SECONDS: float = 1.0
+WRITE_BEHIND_BATCH_SIZE: int = 500
+WRITE_BEHIND_PENDING_TIMEOUT: int = 300
+# После стольких неудачных попыток (паузы между ними удваиваются, всего
+# около 4 минут) операции пачки пишутся по одной, а незаписанные
+# откладываются в WRITE_BEHIND_SPOOL_DIR/*.failed.
+WRITE_BEHIND_MAX_ATTEMPTS: int = 8
+WRITE_BEHIND_SPOOL_DIR = os.path.join(BASE_DIR, 'spool')
+# Конфигурация полнотекстового поиска PostgreSQL.
+SEARCH_CONFIG = 'russian'
+
+TEMPLATES = [
+    {
+        'BACKEND': 'core.instrumentation.TimedDjangoTemplates',
+        'DIRS': [os.path.join(BASE_DIR, 'templates')],
+        'APP_DIRS': True,
+        'OPTIONS': {
+            'context_processors': [
+                'django.template.context_processors.debug',
+                'django.template.context_processors.request',
+                'django.contrib.auth.context_processors.auth',
+                'django.contrib.messages.context_processors.messages',
+                'core.context_processors.year.year',
+            ],
+        },
+    },
+]
+
+# Компилировать все шаблоны из DIRS при запуске воркера (wsgi.py), см.
+# core/templating.py. Имеет смысл только с кеширующим загрузчиком.
+TEMPLATE_WARMUP: bool = False
+
+WSGI_APPLICATION = 'yatube.wsgi.application'
+
+
+# Database
+# https://docs.djangoproject.com/en/2.2/ref/settings/#databases
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    }
+}
+
+
+# Password validation
+# https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
+
+AUTH_PASSWORD_VALIDATORS = [
+    {
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'UserAttributeSimilarityValidator'),
+    },
+    {
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'MinimumLengthValidator'),
+    },
+    {
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'CommonPasswordValidator'),
+    },
+    {
+        'NAME': ('django.contrib.auth.password_validation.'
+                 'NumericPasswordValidator'),
+    },
+]
+
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'core.queries': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+
+# Internationalization
+# https://docs.djangoproject.com/en/2.2/topics/i18n/
+
+LANGUAGE_CODE = 'ru-RU'
+
+TIME_ZONE = 'UTC'
+
+USE_I18N = True
+
+USE_L10N = False
+
+USE_TZ = True
+
+
+# Static files (CSS, JavaScript, Images)
+# https://docs.djangoproject.com/en/2.2/howto/static-files/
+
+STATIC_URL = '/static/'
+STATICFILES_DIRS = (os.path.join(BASE_DIR, 'static'),)
+STATIC_ROOT = os.path.join(BASE_DIR, 'collected_static')
+# Раздавать STATIC_ROOT из процесса (core.staticfiles), когда перед
+# приложением нет веб-сервера. Файлы с хешем в имени кешируются на год,
+# остальные — на STATIC_MAX_AGE секунд.
+STATIC_SERVE: bool = False
+STATIC_MAX_AGE: int = 60
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Кеш выбирается переменными окружения:
+# YATUBE_CACHE_BACKEND — locmem (по умолчанию, свой у каждого процесса),
+#   file (общий каталог на машине) или redis (нужен пакет django-redis);
+# YATUBE_CACHE_LOCATION — каталог для file или URL для redis;
+# YATUBE_CACHE_LOCAL_TIER=1 — держать самые горячие фрагменты лент ещё
+#   и в LRU внутри процесса, перед общим кешем.
+CACHE_BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'file': 'django.core.cache.backends.filebased.FileBasedCache',
+    'redis': 'django_redis.cache.RedisCache',
+}
+CACHE_BACKEND = os.getenv('YATUBE_CACHE_BACKEND', 'locmem')
+CACHE_DEFAULT_LOCATIONS = {
+    'locmem': '',
+    'file': os.path.join(BASE_DIR, 'cache'),
+    'redis': 'redis://127.0.0.1:6379/1',
+}
+SHARED_CACHE = {
+    'BACKEND': CACHE_BACKENDS[CACHE_BACKEND],
+    'LOCATION': os.getenv(
+        'YATUBE_CACHE_LOCATION', CACHE_DEFAULT_LOCATIONS[CACHE_BACKEND]
+    ),
+}
+
+if os.getenv('YATUBE_CACHE_LOCAL_TIER') == '1':
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.TwoTierCache',
+            'OPTIONS': {
+                'SHARED': 'shared',
+                'LOCAL_PREFIXES': ['feed:frag:'],
+                'LOCAL_MAX_ENTRIES': 128,
+                'LOCAL_TIMEOUT': 60,
+            },
+        },
+        'shared': SHARED_CACHE,
+    }
+else:
+    CACHES = {
+        'default': SHARED_CACHE,
+    }
+# Общий ли кеш для всех процессов сайта. Счётчики поколений лент живут в
+# кеше, а locmem у каждого воркера свой: без общего кеша фрагменты лент
+# хранятся лишь FEED_CACHE_LOCAL_TIMEOUT, а ответы 304 не отдаются.
+CACHE_SHARED: bool = CACHE_BACKEND != 'locmem'
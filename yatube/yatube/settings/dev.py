@@ -0,0 +1,16 @@
+"""Настройки для разработки: DEBUG и django-debug-toolbar."""
+from .base import *  # noqa: F401,F403
+from .base import INSTALLED_APPS, MIDDLEWARE
+
+DEBUG = True
+
+INTERNAL_IPS = [
+    '127.0.0.1',
+]
+
+INSTALLED_APPS = [*INSTALLED_APPS, 'debug_toolbar']
+
+MIDDLEWARE = [*MIDDLEWARE, 'debug_toolbar.middleware.DebugToolbarMiddleware']
+
+# runserver и тесты работают в одном процессе: его locmem и есть общий кеш.
+CACHE_SHARED = True
@@ -0,0 +1,29 @@
+"""Боевые настройки: ничего отладочного не подключается."""
+import os
+from copy import deepcopy
+
+from .base import *  # noqa: F401,F403
+from .base import MIDDLEWARE, SECRET_KEY, TEMPLATES
+
+DEBUG = False
+
+SECRET_KEY = os.getenv('YATUBE_SECRET_KEY', SECRET_KEY)
+
+# Скомпилированные шаблоны живут в памяти воркера. Django и так
+# включает кеширующий загрузчик без DEBUG, но явный список не зависит
+# от DEBUG и позволяет прогреть кеш при запуске.
+TEMPLATES = deepcopy(TEMPLATES)
+TEMPLATES[0]['APP_DIRS'] = False
+TEMPLATES[0]['OPTIONS']['loaders'] = [
+    ('django.template.loaders.cached.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+
+TEMPLATE_WARMUP = True
+
+# Имена статики с хешем содержимого и сжатые копии, см. core/staticfiles.py.
+STATICFILES_STORAGE = 'core.staticfiles.CompressedManifestStaticFilesStorage'
+STATIC_SERVE = True
+MIDDLEWARE = ['core.staticfiles.StaticFilesMiddleware', *MIDDLEWARE]
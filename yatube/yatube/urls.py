@@ -24,6 +24,8 @@ urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('api/v1/', include('api.urls', namespace='api')),
+    path('core/', include('core.urls', namespace='core')),
 ]
 
 handler404 = 'core.views.page_not_found'
@@ -31,11 +33,12 @@ handler403 = 'core.views.permission_denied'
 handler500 = 'core.views.server_error'
 # handler403csrf = 'core.views.csrf_failure'
 
-if s.DEBUG:
+if 'debug_toolbar' in s.INSTALLED_APPS:
     import debug_toolbar
 
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
 
+if s.DEBUG:
     urlpatterns += static(
         s.MEDIA_URL, document_root=s.MEDIA_ROOT
     )